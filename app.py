@@ -3,31 +3,98 @@ from flask import Flask, render_template, request, redirect, session, flash, url
 import functools
 import hashlib
 from model.BD import DB  # Importamos tu clase DB
-from model.db_orm import get_session, engine
-from sqlalchemy import func
-from model.models import Persona, Turno, Nivel, Municipio, Asunto, User, Base
-from services.pdf_service import PDFGenerator
+from model.db_orm import engine, SessionLocal, pool_stats
+from sqlalchemy import func, select, text, or_, and_
+from sqlalchemy.orm import contains_eager
+from model.models import Persona, Turno, Nivel, Municipio, Asunto, User, Base, TurnoStats
+from services.pdf_service import PDFGenerator, PDFCache
+from services.turno_sequence import TurnoSequence
+from services.pdf_jobs import PDFJobQueue
+from services import persona_search, turno_stats, turno_import, persona_repository
+from services.catalog_cache import CatalogCache
+from services.event_bus import EventBus
+from services.request_session import RequestSession
+from services.metrics import Registry, RequestMetrics
+from services.query_profiler import QueryProfiler
 import os
-from contextlib import contextmanager
+import re
+import io
+import csv
+import secrets
+import json
+import base64
+from datetime import datetime, timedelta
 from flask import abort
+from itsdangerous import URLSafeTimedSerializer, BadSignature
 
 # Inicializar generador de PDF
 pdf_generator = PDFGenerator()
 
-@contextmanager
+# Asignador de números de turno por municipio (contador atómico en BD)
+turno_sequence = TurnoSequence(engine)
+
+_CATALOG_MAP = {
+    'nivel': {
+        'model': Nivel,
+        'pk': 'id_nivel',
+        'name_field': 'nombre_nivel'
+    },
+    'municipio': {
+        'model': Municipio,
+        'pk': 'id_municipio',
+        'name_field': 'nombre_municipio'
+    },
+    'asunto': {
+        'model': Asunto,
+        'pk': 'id_asunto',
+        'name_field': 'nombre_asunto'
+    }
+}
+
+# Catálogos en memoria, invalidados por versión (ver services/catalog_cache.py)
+catalog_cache = CatalogCache(SessionLocal, _CATALOG_MAP)
+
+# Contadores del dashboard (turno_stats) actualizados en cada flush de turnos
+turno_stats.registrar(SessionLocal)
+
+# Avisos en vivo al panel de administración (SSE); se publican al confirmar
+event_bus = EventBus()
+event_bus.registrar(SessionLocal)
+
+# Una sesión ORM por petición (se confirma antes de enviar la respuesta)
+request_db = RequestSession(SessionLocal)
+
 def orm_session():
-    """Context manager sencillo para sesiones ORM (usa get_session generator)
+    """Sesión ORM de la petición en curso: se abre en el primer uso, se
+    confirma si la respuesta es < 400 y se deshace en otro caso.
     Uso: with orm_session() as session: ..."""
-    gen = get_session()
-    session = next(gen)
-    try:
-        yield session
-        try:
-            next(gen)
-        except StopIteration:
-            pass
-    finally:
-        pass
+    return request_db.session()
+
+# Consultas lentas y N+1 en líneas JSON (QUERY_PROFILER=1 o archivo bandera)
+query_profiler = QueryProfiler()
+
+# Métricas en formato Prometheus (/metrics con METRICS_TOKEN o sesión de admin)
+metricas = Registry()
+request_metrics = RequestMetrics(metricas, request_db.tiempos)
+pdf_render = metricas.histogram('pdf_render_seconds', 'Duración del render de comprobantes PDF.', ('tipo',))
+
+def _metrica_pool(clave, escala=1):
+    def leer():
+        valor = pool_stats().get(clave)
+        return None if valor is None else valor * escala
+    return leer
+
+for _nombre, _clave, _escala, _tipo, _ayuda in (
+    ('db_pool_size', 'size', 1, 'gauge', 'Tamaño del pool de conexiones.'),
+    ('db_pool_checked_out', 'checked_out', 1, 'gauge', 'Conexiones en uso.'),
+    ('db_pool_checked_in', 'checked_in', 1, 'gauge', 'Conexiones libres en el pool.'),
+    ('db_pool_overflow', 'overflow', 1, 'gauge', 'Conexiones de overflow abiertas.'),
+    ('db_pool_checkouts_total', 'checkouts', 1, 'counter', 'Checkouts de conexión.'),
+    ('db_pool_wait_seconds_total', 'wait_total_ms', 0.001, 'counter', 'Tiempo total de espera por una conexión.'),
+    ('db_pool_wait_max_seconds', 'wait_max_ms', 0.001, 'gauge', 'Mayor espera por una conexión.'),
+    ('db_pool_timeouts_total', 'timeouts', 1, 'counter', 'Checkouts que agotaron DB_POOL_TIMEOUT.'),
+):
+    metricas.callback(_nombre, _ayuda, _metrica_pool(_clave, _escala), _tipo)
 
 # Asegurar que los modelos estén mapeados (no crea tablas si ya existen con la misma estructura)
 try:
@@ -38,6 +105,24 @@ except Exception:
 
 app = Flask(__name__)
 app.secret_key = "clave_secreta_para_sesiones"  # Es necesario para sesiones
+# Las métricas se registran antes que la sesión por petición para medir su COMMIT
+request_metrics.registrar(app)
+request_db.registrar(app, engine)
+query_profiler.registrar(app, engine)
+
+# Cola de generación de PDFs fuera de la petición (pool de procesos) y caché
+# por contenido para no regenerar comprobantes que no cambiaron
+pdf_jobs = PDFJobQueue(os.path.join(app.static_folder, 'pdfs'))
+pdf_cache = PDFCache(pdf_jobs.pdf_dir)
+pdf_generator.observador = pdf_jobs.observador = lambda tipo, segundos: pdf_render.observe(segundos, tipo=tipo)
+
+# PDF_MODE=stream: los PDFs se generan en memoria y se sirven desde
+# /api/turno/<id>/pdf, sin escribir en static/pdfs (útil con varios nodos)
+PDF_STREAM = os.getenv('PDF_MODE', 'file').lower() == 'stream'
+# El enlace lleva el id del turno firmado (no la CURP) y vence a los
+# PDF_TOKEN_MAX_AGE segundos
+PDF_TOKEN_MAX_AGE = int(os.getenv('PDF_TOKEN_MAX_AGE', '3600'))
+pdf_tokens = URLSafeTimedSerializer(app.secret_key, salt='turno-pdf')
 
 SECRET_KEY_RECAPTCHA = "6Ldm5wIsAAAAAO9Vx_wxdEvZymkTPJ3OYX-hiQW9"  # Tu secret key
 
@@ -144,6 +229,17 @@ def registro():
     return render_template('registro.html')
 
 
+def _persona_y_turno(db, curp, numero_turno):
+    """Persona por CURP y su turno con ese número en una sola consulta.
+    El LEFT JOIN distingue CURP inexistente (None, None) de turno inexistente
+    (persona, None). Usa el índice único de curp y el índice
+    idx_persona_numero (id_persona, numero_turno)."""
+    row = db.query(Persona, Turno).outerjoin(
+        Turno, and_(Turno.id_persona == Persona.id_persona, Turno.numero_turno == numero_turno)
+    ).filter(Persona.curp == curp).first()
+    return row if row else (None, None)
+
+
 @app.route('/api/buscar-turno', methods=['POST'])
 def buscar_turno():
     """Busca un turno por número de turno y CURP"""
@@ -156,26 +252,13 @@ def buscar_turno():
             return jsonify({'success': False, 'error': 'Se requiere número de turno y CURP'}), 400
 
         with orm_session() as db:
-            # Buscar persona por CURP
-            persona = db.query(Persona).filter(Persona.curp == curp).first()
+            persona, turno = _persona_y_turno(db, curp, numero_turno)
             if not persona:
                 return jsonify({'success': False, 'error': 'CURP no encontrada'}), 404
-
-            # Buscar turno asociado a la persona
-            turno = db.query(Turno).filter(
-                Turno.id_persona == persona.id_persona,
-                Turno.numero_turno == numero_turno
-            ).first()
-
             if not turno:
                 return jsonify({'success': False, 'error': 'Turno no encontrado'}), 404
 
-            # Obtener datos relacionados
-            nivel = db.query(Nivel).filter(Nivel.id_nivel == turno.id_nivel).first()
-            municipio = db.query(Municipio).filter(Municipio.id_municipio == turno.id_municipio).first()
-            asunto = db.query(Asunto).filter(Asunto.id_asunto == turno.id_asunto).first()
-
-            # Preparar respuesta
+            # Preparar respuesta (nombres de catálogo desde la caché)
             turno_data = {
                 'id': turno.id,
                 'numero_turno': turno.numero_turno,
@@ -187,9 +270,9 @@ def buscar_turno():
                 'telefono': persona.telefono,
                 'celular': persona.celular,
                 'correo': persona.correo,
-                'nivel': nivel.nombre_nivel,
-                'municipio': municipio.nombre_municipio,
-                'asunto': asunto.nombre_asunto,
+                'nivel': catalog_cache.nombre_por_id('nivel', turno.id_nivel),
+                'municipio': catalog_cache.nombre_por_id('municipio', turno.id_municipio),
+                'asunto': catalog_cache.nombre_por_id('asunto', turno.id_asunto),
                 'fecha_registro': turno.fecha_registro.isoformat() if turno.fecha_registro else None
             }
 
@@ -211,115 +294,189 @@ def actualizar_turno():
             return jsonify({'success': False, 'error': 'Se requiere número de turno y CURP'}), 400
 
         with orm_session() as db:
-            # Buscar persona por CURP
-            persona = db.query(Persona).filter(Persona.curp == curp).first()
+            persona, turno = _persona_y_turno(db, curp, numero_turno)
             if not persona:
                 return jsonify({'success': False, 'error': 'CURP no encontrada'}), 404
-
-            # Actualizar datos de la persona
-            persona.nombre_completo = data.get('nombreCompleto', persona.nombre_completo)
-            persona.nombre = data.get('nombre', persona.nombre)
-            persona.paterno = data.get('paterno', persona.paterno)
-            persona.materno = data.get('materno', persona.materno)
-            persona.telefono = data.get('telefono', persona.telefono)
-            persona.celular = data.get('celular', persona.celular)
-            persona.correo = data.get('correo', persona.correo)
-
-            # Buscar turno
-            turno = db.query(Turno).filter(
-                Turno.id_persona == persona.id_persona,
-                Turno.numero_turno == numero_turno
-            ).first()
-
             if not turno:
                 return jsonify({'success': False, 'error': 'Turno no encontrado'}), 404
 
-            # Actualizar referencias del turno
+            # Actualizar datos de la persona (los campos omitidos se conservan)
+            datos_persona = {
+                'nombre_completo': data.get('nombreCompleto', persona.nombre_completo),
+                'nombre': data.get('nombre', persona.nombre),
+                'paterno': data.get('paterno', persona.paterno),
+                'materno': data.get('materno', persona.materno),
+                'telefono': data.get('telefono', persona.telefono),
+                'celular': data.get('celular', persona.celular),
+                'correo': data.get('correo', persona.correo)
+            }
+            persona_repository.actualizar(db, curp, datos_persona)
+
+            # Actualizar referencias del turno (ids resueltos desde la caché de catálogos)
             if 'nivel' in data:
-                nivel = db.query(Nivel).filter(Nivel.nombre_nivel.ilike(data['nivel'])).first()
-                if nivel:
-                    turno.id_nivel = nivel.id_nivel
+                id_nivel = catalog_cache.id_por_nombre('nivel', data['nivel'])
+                if id_nivel:
+                    turno.id_nivel = id_nivel
 
             if 'municipio' in data:
-                municipio = db.query(Municipio).filter(Municipio.nombre_municipio.ilike(data['municipio'])).first()
-                if municipio:
-                    turno.id_municipio = municipio.id_municipio
+                id_municipio = catalog_cache.id_por_nombre('municipio', data['municipio'])
+                if id_municipio:
+                    turno.id_municipio = id_municipio
 
             if 'asunto' in data:
-                asunto = db.query(Asunto).filter(Asunto.nombre_asunto.ilike(data['asunto'])).first()
-                if asunto:
-                    turno.id_asunto = asunto.id_asunto
-
-            # Obtener datos actualizados para el PDF
-            nivel = db.query(Nivel).filter(Nivel.id_nivel == turno.id_nivel).first()
-            municipio = db.query(Municipio).filter(Municipio.id_municipio == turno.id_municipio).first()
-            asunto = db.query(Asunto).filter(Asunto.id_asunto == turno.id_asunto).first()
-
-            # Generar nuevo PDF
-            pdf_dir = os.path.join(app.static_folder, 'pdfs')
-            os.makedirs(pdf_dir, exist_ok=True)
-            pdf_filename = f'turno_{turno.id}_actualizado.pdf'
-            pdf_path = os.path.join(pdf_dir, pdf_filename)
-            
-            pdf_generator.generate_ticket_pdf({
-                'numero_turno': turno.numero_turno,
-                'municipio': municipio.nombre_municipio,
-                'curp': persona.curp,
-                'nombre_completo': persona.nombre_completo,
-                'nombre': persona.nombre,
-                'paterno': persona.paterno,
-                'materno': persona.materno,
-                'nivel': nivel.nombre_nivel,
-                'asunto': asunto.nombre_asunto,
-                'fecha_registro': turno.fecha_registro
-            }, pdf_path)
+                id_asunto = catalog_cache.id_por_nombre('asunto', data['asunto'])
+                if id_asunto:
+                    turno.id_asunto = id_asunto
+
+            # Nombres actualizados para el PDF
+            nombre_nivel = catalog_cache.nombre_por_id('nivel', turno.id_nivel)
+            nombre_municipio = catalog_cache.nombre_por_id('municipio', turno.id_municipio)
+            nombre_asunto = catalog_cache.nombre_por_id('asunto', turno.id_asunto)
+
+            # Encolar nuevo PDF solo si cambiaron los datos del comprobante
+            pdf_job = _encolar_pdf(turno.id, dict(
+                datos_persona,
+                numero_turno=turno.numero_turno,
+                municipio=nombre_municipio,
+                curp=curp,
+                nivel=nombre_nivel,
+                asunto=nombre_asunto,
+                fecha_registro=turno.fecha_registro
+            ))
 
             # Preparar respuesta
             turno_data = {
                 'id': turno.id,
                 'numero_turno': turno.numero_turno,
-                'nombre_completo': persona.nombre_completo,
-                'curp': persona.curp,
-                'telefono': persona.telefono,
-                'correo': persona.correo,
-                'nivel': nivel.nombre_nivel,
-                'municipio': municipio.nombre_municipio,
-                'asunto': asunto.nombre_asunto,
+                'nombre_completo': datos_persona['nombre_completo'],
+                'curp': curp,
+                'telefono': datos_persona['telefono'],
+                'correo': datos_persona['correo'],
+                'nivel': nombre_nivel,
+                'municipio': nombre_municipio,
+                'asunto': nombre_asunto,
                 'fecha_registro': turno.fecha_registro,
-                'pdf_url': f'/static/pdfs/{pdf_filename}'
+                'pdf_url': _pdf_url(turno.id, pdf_job)
             }
 
-            return jsonify({'success': True, 'turno': turno_data})
+            return jsonify({'success': True, 'turno': turno_data,
+                            'pdf_job': _pdf_job_info(pdf_job, turno_data['pdf_url'])})
 
     except Exception as e:
         print('Error en actualizar_turno:', e)
         return jsonify({'success': False, 'error': str(e)}), 500
 
 
+def _parse_fecha(valor):
+    """Convierte 'YYYY-MM-DD' en datetime; lanza ValueError si no es válida."""
+    try:
+        return datetime.strptime(valor.strip(), '%Y-%m-%d')
+    except ValueError:
+        raise ValueError(f'Fecha inválida: {valor} (use AAAA-MM-DD)')
+
+
+def _filtrar_turnos(query, filtros):
+    """Aplica los filtros comunes del panel sobre una consulta de Turno.
+    Filtros: curp, nombre (requieren que la consulta incluya Persona), municipio,
+    estatus, desde y hasta (YYYY-MM-DD, ambos inclusivos).
+    Lanza ValueError si una fecha no es válida."""
+    curp = (filtros.get('curp') or '').strip().upper()
+    nombre = (filtros.get('nombre') or '').strip()
+    if curp:
+        query = query.filter(Persona.curp == curp)
+    elif nombre:
+        # índice FULLTEXT sobre el nombre normalizado (sin acentos ni mayúsculas)
+        query = persona_search.filtrar_por_nombre(query, nombre)
+
+    municipio = (filtros.get('municipio') or '').strip()
+    if municipio and municipio != 'todos':
+        id_municipio = select(Municipio.id_municipio).where(
+            Municipio.nombre_municipio == municipio).scalar_subquery()
+        query = query.filter(Turno.id_municipio == id_municipio)
+
+    estatus = (filtros.get('estatus') or '').strip()
+    if estatus:
+        if estatus not in ('Pendiente', 'Resuelto'):
+            raise ValueError('Estatus inválido')
+        query = query.filter(Turno.estatus == estatus)
+
+    if filtros.get('desde'):
+        query = query.filter(Turno.fecha_registro >= _parse_fecha(filtros['desde']))
+    if filtros.get('hasta'):
+        query = query.filter(Turno.fecha_registro < _parse_fecha(filtros['hasta']) + timedelta(days=1))
+    return query
+
+
+SEARCH_PAGE_SIZE = 50
+SEARCH_MAX_PAGE_SIZE = 200
+
+
+def _encode_cursor(turno):
+    """Cursor opaco con la posición (fecha_registro, id) del último turno."""
+    raw = json.dumps([turno.fecha_registro.isoformat() if turno.fecha_registro else None, turno.id])
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+def _decode_cursor(cursor):
+    """Inverso de _encode_cursor; lanza ValueError si el cursor no es válido."""
+    try:
+        fecha, turno_id = json.loads(base64.urlsafe_b64decode(cursor.encode()).decode())
+        return (datetime.fromisoformat(fecha) if fecha else None), int(turno_id)
+    except Exception:
+        raise ValueError('Cursor inválido')
+
+
+def _contar_turnos(db, query, modo, hay_filtros):
+    """Devuelve (total, es_estimado). Con modo 'estimate' y sin filtros usa la
+    estadística de la tabla en MySQL (instantánea) en lugar de COUNT(*)."""
+    if modo == 'estimate' and not hay_filtros and db.bind.dialect.name == 'mysql':
+        estimado = db.execute(text(
+            "SELECT TABLE_ROWS FROM information_schema.TABLES "
+            "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = 'turnos'"
+        )).scalar()
+        if estimado is not None:
+            return int(estimado), True
+    return query.order_by(None).count(), False
+
+
 @app.route('/api/admin/search-turnos', methods=['POST'])
 @require_admin
 def admin_search_turnos():
-    """Buscar turnos por CURP o por nombre (administradores). Devuelve lista de turnos."""
+    """Buscar turnos por CURP o por nombre (administradores).
+    Paginado por cursor sobre (fecha_registro, id), del más reciente al más antiguo.
+    Parámetros opcionales: limit (máx. 200), cursor (next_cursor de la página
+    anterior) y count ('exact' o 'estimate') para incluir el total."""
     try:
         data = request.get_json() or {}
-        curp = data.get('curp', '').strip().upper()
-        nombre = data.get('nombre', '').strip()
+        try:
+            limit = min(max(int(data.get('limit') or SEARCH_PAGE_SIZE), 1), SEARCH_MAX_PAGE_SIZE)
+            cursor = _decode_cursor(data['cursor']) if data.get('cursor') else None
+        except (TypeError, ValueError) as e:
+            return jsonify({'success': False, 'error': str(e) or 'Parámetros inválidos'}), 400
+        count_mode = data.get('count')
 
         with orm_session() as db:
-            query = db.query(Turno).join(Persona)
-            if curp:
-                query = query.filter(Persona.curp == curp)
-            elif nombre:
-                # buscar por nombre completo o por partes (ilike)
-                like = f"%{nombre}%"
-                query = query.filter(Persona.nombre_completo.ilike(like))
+            filtros = {'curp': data.get('curp'), 'nombre': data.get('nombre')}
+            base = _filtrar_turnos(db.query(Turno).join(Turno.persona), filtros)
+
+            # Una sola consulta: Persona viene del JOIN del filtro y los
+            # nombres de catálogo de la caché, sin consultas adicionales por fila
+            query = base.options(contains_eager(Turno.persona))
+            if cursor:
+                fecha, ultimo_id = cursor
+                query = query.filter(or_(
+                    Turno.fecha_registro < fecha,
+                    and_(Turno.fecha_registro == fecha, Turno.id < ultimo_id)
+                ))
+
+            # Se pide un registro extra para saber si hay más páginas
+            turnos = query.order_by(Turno.fecha_registro.desc(), Turno.id.desc()).limit(limit + 1).all()
+            has_more = len(turnos) > limit
+            turnos = turnos[:limit]
 
             resultados = []
-            for turno in query.order_by(Turno.fecha_registro.desc()).all():
-                persona = db.query(Persona).filter(Persona.id_persona == turno.id_persona).first()
-                nivel = db.query(Nivel).filter(Nivel.id_nivel == turno.id_nivel).first()
-                municipio = db.query(Municipio).filter(Municipio.id_municipio == turno.id_municipio).first()
-                asunto = db.query(Asunto).filter(Asunto.id_asunto == turno.id_asunto).first()
+            for turno in turnos:
+                persona = turno.persona
 
                 resultados.append({
                     'id': turno.id,
@@ -332,20 +489,273 @@ def admin_search_turnos():
                     'telefono': persona.telefono if persona else None,
                     'celular': persona.celular if persona else None,
                     'correo': persona.correo if persona else None,
-                    'nivel': nivel.nombre_nivel if nivel else None,
-                    'municipio': municipio.nombre_municipio if municipio else None,
-                    'asunto': asunto.nombre_asunto if asunto else None,
+                    'nivel': catalog_cache.nombre_por_id('nivel', turno.id_nivel),
+                    'municipio': catalog_cache.nombre_por_id('municipio', turno.id_municipio),
+                    'asunto': catalog_cache.nombre_por_id('asunto', turno.id_asunto),
                     'estatus': turno.estatus,
                     'fecha_registro': turno.fecha_registro.isoformat() if turno.fecha_registro else None
                 })
 
-            return jsonify({'success': True, 'turnos': resultados})
+            respuesta = {
+                'success': True,
+                'turnos': resultados,
+                'has_more': has_more,
+                'next_cursor': _encode_cursor(turnos[-1]) if has_more else None
+            }
+            if count_mode in ('exact', 'estimate'):
+                hay_filtros = any((v or '').strip() for v in filtros.values())
+                respuesta['total'], respuesta['total_is_estimate'] = _contar_turnos(db, base, count_mode, hay_filtros)
+            return jsonify(respuesta)
 
     except Exception as e:
         print('Error en admin_search_turnos:', e)
         return jsonify({'success': False, 'error': str(e)}), 500
 
 
+@app.route('/api/admin/personas/buscar', methods=['GET'])
+@require_admin
+def admin_buscar_personas():
+    """Busca personas por nombre (parcial, sin importar acentos), ordenadas por relevancia."""
+    texto = request.args.get('q', '').strip()
+    try:
+        limit = min(max(int(request.args.get('limit', 20)), 1), 100)
+    except ValueError:
+        return jsonify({'success': False, 'error': 'limit inválido'}), 400
+
+    try:
+        with orm_session() as db:
+            resultados = persona_search.buscar_personas(db, texto, limit)
+            return jsonify({'success': True, 'personas': [{
+                'id': p.id_persona,
+                'curp': p.curp,
+                'nombre_completo': p.nombre_completo,
+                'score': score
+            } for p, score in resultados]})
+    except Exception as e:
+        print('Error en admin_buscar_personas:', e)
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+
+# Máximo de comprobantes por PDF exportado
+PDF_EXPORT_MAX_FILAS = int(os.getenv('PDF_EXPORT_MAX_FILAS', '2000'))
+# Las exportaciones no van a static/: solo las descarga un administrador
+PDF_EXPORT_DIR = os.path.join(app.instance_path, 'exports')
+PDF_EXPORT_MAX_AGE = int(os.getenv('PDF_EXPORT_MAX_AGE', '3600'))
+
+
+def _export_pdf_path(job_id):
+    return os.path.join(PDF_EXPORT_DIR, f'{job_id}.pdf')
+
+
+def _limpiar_exportaciones():
+    """Borra las exportaciones con más de PDF_EXPORT_MAX_AGE segundos."""
+    limite = datetime.now().timestamp() - PDF_EXPORT_MAX_AGE
+    for entry in os.scandir(PDF_EXPORT_DIR):
+        try:
+            if entry.is_file(follow_symlinks=False) and entry.stat().st_mtime < limite:
+                os.remove(entry.path)
+        except OSError:
+            pass
+
+
+@app.route('/api/admin/turnos/export.pdf', methods=['GET'])
+@require_admin
+def export_turnos_pdf():
+    """Exporta en un solo PDF (un comprobante por página) los turnos filtrados
+    por municipio, estatus y rango de fechas (desde/hasta).
+    El PDF se dibuja en la cola de PDFs, fuera de la petición: responde 202
+    con el trabajo y el administrador consulta `status_url`, que entrega el
+    PDF cuando está listo. Responde 413 si el filtro devuelve más de
+    PDF_EXPORT_MAX_FILAS turnos."""
+    try:
+        with orm_session() as db:
+            query = db.query(
+                Turno.numero_turno, Turno.fecha_registro,
+                Persona.curp, Persona.nombre_completo, Persona.nombre, Persona.paterno, Persona.materno,
+                Municipio.nombre_municipio, Nivel.nombre_nivel, Asunto.nombre_asunto
+            ).join(Persona, Turno.id_persona == Persona.id_persona) \
+             .join(Municipio, Turno.id_municipio == Municipio.id_municipio) \
+             .outerjoin(Nivel, Turno.id_nivel == Nivel.id_nivel) \
+             .outerjoin(Asunto, Turno.id_asunto == Asunto.id_asunto)
+            try:
+                query = _filtrar_turnos(query, request.args)
+            except ValueError as e:
+                return jsonify({'success': False, 'error': str(e)}), 400
+
+            # Una fila de más basta para saber si se pasa del máximo
+            rows = query.order_by(Municipio.nombre_municipio, Turno.numero_turno) \
+                .limit(PDF_EXPORT_MAX_FILAS + 1).all()
+            if len(rows) > PDF_EXPORT_MAX_FILAS:
+                return jsonify({'success': False, 'error': f'La exportación excede {PDF_EXPORT_MAX_FILAS} turnos; '
+                                'acote el filtro (municipio, estatus, desde/hasta)'}), 413
+
+        turnos = [{
+            'numero_turno': r.numero_turno,
+            'municipio': r.nombre_municipio,
+            'curp': r.curp,
+            'nombre_completo': r.nombre_completo,
+            'nombre': r.nombre,
+            'paterno': r.paterno,
+            'materno': r.materno,
+            'nivel': r.nombre_nivel or '',
+            'asunto': r.nombre_asunto or '',
+            'fecha_registro': r.fecha_registro
+        } for r in rows]
+
+        os.makedirs(PDF_EXPORT_DIR, mode=0o700, exist_ok=True)
+        _limpiar_exportaciones()
+        job_id = f'export_{secrets.token_hex(16)}'
+        pdf_jobs.submit_lote(job_id, turnos, _export_pdf_path(job_id))
+        return jsonify({'success': True, 'job': {
+            'id': job_id,
+            'turnos': len(turnos),
+            'status': pdf_jobs.status(job_id, _export_pdf_path(job_id)),
+            'status_url': url_for('export_turnos_pdf_job', job_id=job_id),
+        }}), 202
+    except Exception as e:
+        print('Error en export_turnos_pdf:', e)
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+
+@app.route('/api/admin/turnos/export.pdf/<string:job_id>', methods=['GET'])
+@require_admin
+def export_turnos_pdf_job(job_id):
+    """Estado de una exportación PDF: 202 mientras se genera, el PDF cuando
+    está listo, 404 si no existe o ya se borró (PDF_EXPORT_MAX_AGE)."""
+    if not re.fullmatch(r'export_[0-9a-f]{32}', job_id):
+        return jsonify({'success': False, 'error': 'Trabajo inválido'}), 400
+    path = _export_pdf_path(job_id)
+    estado = pdf_jobs.status(job_id, path)
+    if estado == 'ready':
+        return send_file(path, mimetype='application/pdf', download_name='turnos.pdf')
+    if estado == 'pending':
+        return jsonify({'success': True, 'job': {'id': job_id, 'status': estado}}), 202
+    if estado == 'error':
+        return jsonify({'success': False, 'error': 'No se pudo generar la exportación'}), 500
+    return jsonify({'success': False, 'error': 'Exportación no encontrada'}), 404
+
+
+# Columnas disponibles en la exportación CSV/NDJSON (en este orden por defecto)
+EXPORT_COLUMNAS = {
+    'id': Turno.id,
+    'numero_turno': Turno.numero_turno,
+    'estatus': Turno.estatus,
+    'fecha_registro': Turno.fecha_registro,
+    'curp': Persona.curp,
+    'nombre_completo': Persona.nombre_completo,
+    'nombre': Persona.nombre,
+    'paterno': Persona.paterno,
+    'materno': Persona.materno,
+    'telefono': Persona.telefono,
+    'celular': Persona.celular,
+    'correo': Persona.correo,
+    'municipio': Turno.id_municipio,
+    'nivel': Turno.id_nivel,
+    'asunto': Turno.id_asunto,
+}
+EXPORT_LOTE = 1000
+
+
+def _export_filas(columnas, filtros):
+    """Prepara la consulta de exportación y devuelve un generador de dicts.
+    La consulta usa un cursor del lado del servidor (stream_results) y se lee
+    por lotes, así que la memoria no depende del número de filas; los nombres
+    de catálogo salen de la caché en lugar de tres JOIN más.
+    Lanza ValueError si un filtro no es válido (antes de leer nada)."""
+    db = SessionLocal()
+    try:
+        query = db.query(*(EXPORT_COLUMNAS[c].label(c) for c in columnas)).select_from(Turno)
+        if any(EXPORT_COLUMNAS[c].class_ is Persona for c in columnas) or \
+                filtros.get('curp') or filtros.get('nombre'):
+            query = query.join(Persona, Turno.id_persona == Persona.id_persona)
+        query = _filtrar_turnos(query, filtros).order_by(Turno.id)
+    except Exception:
+        db.close()
+        raise
+
+    def filas():
+        try:
+            result = query.execution_options(stream_results=True, yield_per=EXPORT_LOTE)
+            for row in result:
+                fila = row._asdict()
+                for cat in ('municipio', 'nivel', 'asunto'):
+                    if cat in fila:
+                        fila[cat] = catalog_cache.nombre_por_id(cat, fila[cat])
+                if fila.get('fecha_registro') is not None:
+                    fila['fecha_registro'] = fila['fecha_registro'].isoformat()
+                yield fila
+        finally:
+            db.close()
+    return filas()
+
+
+# Caracteres con los que Excel/LibreOffice interpretan una celda como fórmula
+CSV_FORMULA = ('=', '+', '-', '@', '\t', '\r')
+
+
+def _celda_csv(valor):
+    """Valor de una celda CSV; el texto que empieza como fórmula se prefija
+    con ' para que la hoja de cálculo lo muestre como texto (inyección de
+    fórmulas con datos capturados en el kiosco)."""
+    if valor is None:
+        return ''
+    if isinstance(valor, str) and valor.startswith(CSV_FORMULA):
+        return "'" + valor
+    return valor
+
+
+def _export_chunks(filas, formato, columnas):
+    """Serializa las filas en bloques de EXPORT_LOTE para no emitir una
+    escritura por fila."""
+    buffer = io.StringIO()
+    if formato == 'csv':
+        # BOM para que Excel reconozca UTF-8 (acentos y ñ)
+        buffer.write('\ufeff')
+        writer = csv.writer(buffer)
+        writer.writerow(columnas)
+        escribir = lambda fila: writer.writerow([_celda_csv(fila[c]) for c in columnas])
+    else:
+        escribir = lambda fila: buffer.write(json.dumps(fila, ensure_ascii=False) + '\n')
+
+    for i, fila in enumerate(filas, 1):
+        escribir(fila)
+        if i % EXPORT_LOTE == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+@app.route('/api/admin/turnos/export.<any(csv, ndjson):formato>', methods=['GET'])
+@require_admin
+def export_turnos_stream(formato):
+    """Exporta en streaming los turnos filtrados como CSV o NDJSON.
+    Acepta los filtros de la búsqueda del panel (curp, nombre, municipio,
+    estatus, desde, hasta) y `columns` (lista separada por comas de
+    EXPORT_COLUMNAS; todas por defecto)."""
+    try:
+        columnas = [c.strip() for c in request.args.get('columns', '').split(',') if c.strip()] \
+            or list(EXPORT_COLUMNAS)
+        invalidas = [c for c in columnas if c not in EXPORT_COLUMNAS]
+        if invalidas:
+            return jsonify({'success': False, 'error': f'Columnas inválidas: {", ".join(invalidas)}'}), 400
+
+        try:
+            filas = _export_filas(columnas, request.args.to_dict())
+        except ValueError as e:
+            return jsonify({'success': False, 'error': str(e)}), 400
+
+        mimetype = 'text/csv' if formato == 'csv' else 'application/x-ndjson'
+        resp = app.response_class(_export_chunks(filas, formato, columnas), mimetype=mimetype)
+        resp.headers['Content-Disposition'] = f'attachment; filename=turnos.{formato}'
+        resp.headers['X-Accel-Buffering'] = 'no'
+        return resp
+    except Exception as e:
+        print('Error en export_turnos_stream:', e)
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+
 @app.route('/api/turno/<int:turno_id>', methods=['DELETE'])
 @require_admin
 def delete_turno(turno_id):
@@ -355,6 +765,11 @@ def delete_turno(turno_id):
             if not turno:
                 return jsonify({'success': False, 'error': 'Turno no encontrado'}), 404
             db.delete(turno)
+            request_db.al_confirmar(db, pdf_cache.eliminar_turnos, [turno.id])
+            event_bus.publicar_al_confirmar(db, 'turno_eliminado', {
+                'id': turno.id, 'numero_turno': turno.numero_turno,
+                'municipio': catalog_cache.nombre_por_id('municipio', turno.id_municipio)
+            })
             return jsonify({'success': True})
     except Exception as e:
         print('Error al eliminar turno:', e)
@@ -375,44 +790,279 @@ def set_turno_status(turno_id):
             if not turno:
                 return jsonify({'success': False, 'error': 'Turno no encontrado'}), 404
             turno.estatus = estatus
+            event_bus.publicar_al_confirmar(db, 'turno_estatus', {
+                'id': turno.id, 'numero_turno': turno.numero_turno,
+                'municipio': catalog_cache.nombre_por_id('municipio', turno.id_municipio),
+                'estatus': estatus
+            })
             return jsonify({'success': True, 'turno': {'id': turno.id, 'estatus': turno.estatus}})
     except Exception as e:
         print('Error al setear estatus:', e)
         return jsonify({'success': False, 'error': str(e)}), 500
 
 
+BULK_MAX_IDS = 5000
+_BULK_FILTROS = ('municipio', 'estatus', 'desde', 'hasta')
+
+
+@app.route('/api/admin/turnos/bulk', methods=['PUT', 'DELETE'])
+@require_admin
+def bulk_turnos():
+    """Cambio de estatus (PUT, {'estatus': ...}) o eliminación (DELETE) de
+    varios turnos en una sola transacción con un UPDATE/DELETE por conjunto.
+    Los turnos se eligen con {'ids': [...]} o con {'filtros': {municipio,
+    estatus, desde, hasta}} (al menos uno). Devuelve el número de afectados."""
+    try:
+        data = request.get_json() or {}
+        ids = data.get('ids')
+        filtros = {k: v for k, v in (data.get('filtros') or {}).items() if k in _BULK_FILTROS and v}
+        estatus = data.get('estatus')
+
+        if request.method == 'PUT' and estatus not in ('Pendiente', 'Resuelto'):
+            return jsonify({'success': False, 'error': 'Estatus inválido'}), 400
+        if ids is not None:
+            if not isinstance(ids, list) or not all(isinstance(i, int) for i in ids):
+                return jsonify({'success': False, 'error': 'ids debe ser una lista de enteros'}), 400
+            if len(ids) > BULK_MAX_IDS:
+                return jsonify({'success': False, 'error': f'Máximo {BULK_MAX_IDS} ids por petición'}), 400
+            if not ids:
+                return jsonify({'success': True, 'afectados': 0})
+        elif not filtros or (filtros.get('municipio') == 'todos' and len(filtros) == 1):
+            return jsonify({'success': False, 'error': 'Indique ids o al menos un filtro'}), 400
+
+        with orm_session() as db:
+            def seleccion(query):
+                if ids is not None:
+                    return query.filter(Turno.id.in_(ids))
+                return _filtrar_turnos(query, filtros)
+
+            # Los contadores del dashboard se corrigen con los valores previos
+            # de las filas afectadas (bloqueadas hasta el commit)
+            deltas = turno_stats.deltas_vacios()
+            if request.method == 'PUT':
+                grupos = seleccion(
+                    db.query(Turno.id_municipio, Turno.estatus, func.count(Turno.id))
+                ).filter(or_(Turno.estatus != estatus, Turno.estatus.is_(None))) \
+                 .group_by(Turno.id_municipio, Turno.estatus).with_for_update().all()
+                for id_municipio, anterior, total in grupos:
+                    deltas[TurnoStats][(id_municipio, anterior or turno_stats.ESTATUS_DEFAULT)] -= total
+                    deltas[TurnoStats][(id_municipio, estatus)] += total
+                afectados = seleccion(db.query(Turno)).filter(
+                    or_(Turno.estatus != estatus, Turno.estatus.is_(None))
+                ).update({Turno.estatus: estatus}, synchronize_session=False)
+                accion = 'estatus'
+            else:
+                columnas = [getattr(Turno, c) for c in turno_stats.CAMPOS]
+                eliminados = []
+                for turno_id, *fila in seleccion(db.query(Turno.id, *columnas)).with_for_update().yield_per(1000):
+                    turno_stats.acumular(deltas, antes=dict(zip(turno_stats.CAMPOS, fila)))
+                    eliminados.append(turno_id)
+                afectados = seleccion(db.query(Turno)).delete(synchronize_session=False)
+                # Sus PDFs ya no tienen a quién servir
+                request_db.al_confirmar(db, pdf_cache.eliminar_turnos, eliminados)
+                accion = 'eliminar'
+
+            turno_stats.aplicar_deltas(db, deltas)
+            if afectados:
+                event_bus.publicar_al_confirmar(db, 'turnos_bulk', {
+                    'accion': accion, 'estatus': estatus if accion == 'estatus' else None,
+                    'afectados': afectados
+                })
+            return jsonify({'success': True, 'afectados': afectados})
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    except Exception as e:
+        print('Error en bulk_turnos:', e)
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+
+IMPORT_MAX_FILAS = int(os.getenv('IMPORT_MAX_FILAS', '50000'))
+
+
+@app.route('/api/admin/turnos/import', methods=['POST'])
+@require_admin
+def import_turnos():
+    """Carga masiva de turnos (registros en papel tras una contingencia).
+
+    Recibe un archivo CSV o NDJSON en el campo `archivo` (mismas columnas que
+    el formulario o que la exportación; fecha_registro opcional). Todas las
+    filas se validan en una pasada y, si alguna falla, no se inserta nada.
+    Con `pdf=1` los comprobantes se encolan en segundo plano después del
+    COMMIT (si la importación se deshace, no se encola ninguno)."""
+    try:
+        archivo = request.files.get('archivo')
+        if not archivo or not archivo.filename:
+            return jsonify({'success': False, 'error': 'Adjunte un archivo en el campo archivo'}), 400
+        formato = (request.form.get('formato') or os.path.splitext(archivo.filename)[1].lstrip('.')).lower()
+        if formato in ('json', 'jsonl'):
+            formato = 'ndjson'
+        if formato not in ('csv', 'ndjson'):
+            return jsonify({'success': False, 'error': 'Formato no soportado (use csv o ndjson)'}), 400
+
+        try:
+            filas, errores, total_errores = turno_import.validar(
+                turno_import.leer_filas(archivo.stream, formato), catalog_cache, IMPORT_MAX_FILAS)
+        except (turno_import.FilaInvalida, UnicodeDecodeError, csv.Error) as e:
+            return jsonify({'success': False, 'error': str(e)}), 400
+        if total_errores:
+            return jsonify({'success': False, 'error': f'{total_errores} fila(s) con errores; no se importó nada',
+                            'errores': errores}), 400
+        if not filas:
+            return jsonify({'success': False, 'error': 'El archivo no contiene filas'}), 400
+
+        with orm_session() as db:
+            resultado = turno_import.importar(db, filas, turno_sequence, session.get('user_id') or 1)
+            event_bus.publicar_al_confirmar(db, 'turnos_bulk', {
+                'accion': 'importar', 'estatus': None, 'afectados': resultado['importados']
+            })
+
+            pdfs = 0
+            if request.form.get('pdf') in ('1', 'true', 'si') and not PDF_STREAM:
+                trabajos = _pdfs_importados(db, filas, resultado['rangos'])
+                request_db.al_confirmar(db, _encolar_pdfs, trabajos)
+                pdfs = len(trabajos)
+
+        return jsonify({
+            'success': True,
+            'importados': resultado['importados'],
+            'personas_nuevas': resultado['personas_nuevas'],
+            'numeros': {
+                catalog_cache.nombre_por_id('municipio', id_mun): [primero, ultimo]
+                for id_mun, (primero, ultimo) in resultado['rangos'].items()
+            },
+            'pdfs_encolados': pdfs
+        })
+    except Exception as e:
+        print('Error en import_turnos:', e)
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+
+def _pdfs_importados(db, filas, rangos):
+    """(turno_id, datos del comprobante) de los turnos recién importados, leídos
+    en la misma transacción (los ids se leen por rango de número en cada
+    municipio)."""
+    por_numero = {(f['id_municipio'], f['numero_turno']): f for f in filas}
+    trabajos = []
+    for id_municipio, (primero, ultimo) in rangos.items():
+        rows = db.query(Turno.id, Turno.numero_turno, Turno.fecha_registro).filter(
+            Turno.id_municipio == id_municipio,
+            Turno.numero_turno.between(primero, ultimo)
+        ).yield_per(500)
+        for turno_id, numero, fecha_registro in rows:
+            fila = por_numero[(id_municipio, numero)]
+            trabajos.append((turno_id, {
+                'numero_turno': numero,
+                'municipio': catalog_cache.nombre_por_id('municipio', id_municipio),
+                'curp': fila['curp'],
+                'nombre_completo': fila['nombre_completo'],
+                'nombre': fila.get('nombre') or '',
+                'paterno': fila.get('paterno') or '',
+                'materno': fila.get('materno') or '',
+                'nivel': catalog_cache.nombre_por_id('nivel', fila['id_nivel']),
+                'asunto': catalog_cache.nombre_por_id('asunto', fila['id_asunto']),
+                'fecha_registro': fecha_registro
+            }))
+    return trabajos
+
+
+def _encolar_pdfs(trabajos):
+    """Acción posterior al COMMIT de la importación (request_db.al_confirmar)."""
+    for turno_id, turno_data in trabajos:
+        _encolar_pdf(turno_id, turno_data)
+
+
+SSE_HEARTBEAT = float(os.getenv('SSE_HEARTBEAT_SECONDS', '15'))
+
+
+@app.route('/api/admin/events', methods=['GET'])
+@require_admin
+def admin_events():
+    """Flujo SSE con los cambios de turnos (turno_creado, turno_estatus,
+    turno_eliminado). Cada conexión ocupa un hilo: requiere un servidor con
+    hilos o workers asíncronos. Un comentario periódico mantiene viva la
+    conexión y detecta clientes desconectados."""
+    sub = event_bus.subscribe()
+    if sub is None:
+        return jsonify({'success': False, 'error': 'Demasiadas conexiones de eventos'}), 503
+
+    def stream():
+        try:
+            yield 'retry: 5000\n\n'
+            while True:
+                eventos, perdidos = sub.get(timeout=SSE_HEARTBEAT)
+                if perdidos:
+                    # El cliente no alcanzó a leer: que recargue todo
+                    yield f'event: resync\ndata: {{"perdidos": {perdidos}}}\n\n'
+                for evento in eventos:
+                    yield EventBus.formato_sse(evento)
+                if not eventos and not perdidos:
+                    yield ': ping\n\n'
+        finally:
+            event_bus.unsubscribe(sub)
+
+    resp = app.response_class(stream(), mimetype='text/event-stream')
+    # El finally de stream() solo corre si el cuerpo se llegó a recorrer (un
+    # HEAD no lo lee): al cerrar la respuesta se libera siempre la suscripción
+    resp.call_on_close(lambda: event_bus.unsubscribe(sub))
+    resp.headers['Cache-Control'] = 'no-cache'
+    resp.headers['X-Accel-Buffering'] = 'no'
+    return resp
+
+
+@app.route('/api/admin/pool-stats', methods=['GET'])
+@require_admin
+def admin_pool_stats():
+    """Estadísticas del pool de conexiones de este proceso (para dimensionar
+    DB_POOL_SIZE/DB_MAX_OVERFLOW contra el número de workers)."""
+    return jsonify({'success': True, 'pool': pool_stats()})
+
+
+@app.route('/api/admin/query-profiler', methods=['GET', 'PUT'])
+@require_admin
+def admin_query_profiler():
+    """Estado del registro de consultas lentas / N+1; PUT {"activo": bool}
+    lo enciende o apaga en todos los workers sin reiniciar."""
+    try:
+        if request.method == 'PUT':
+            data = request.get_json() or {}
+            if not isinstance(data.get('activo'), bool):
+                return jsonify({'success': False, 'error': 'activo debe ser true o false'}), 400
+            query_profiler.cambiar(data['activo'])
+        return jsonify({'success': True, 'profiler': query_profiler.estado()})
+    except Exception as e:
+        print('Error en admin_query_profiler:', e)
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+
 @app.route('/api/admin/dashboard-stats', methods=['GET'])
 @require_admin
 def dashboard_stats():
-    """Obtiene estadísticas de turnos por estatus y municipio para el dashboard"""
+    """Obtiene estadísticas de turnos por estatus y municipio para el dashboard.
+    Lee los contadores de turno_stats: O(#municipios) sin importar cuántos turnos haya."""
     try:
         municipio_filter = request.args.get('municipio', None)
         
         with orm_session() as db:
-            # Query base
-            query = db.query(
-                Municipio.nombre_municipio,
-                Turno.estatus,
-                func.count(Turno.id).label('count')
-            ).join(Municipio, Turno.id_municipio == Municipio.id_municipio)
-            
-            # Aplicar filtro de municipio si existe
+            id_municipio = None
             if municipio_filter and municipio_filter != 'todos':
-                query = query.filter(Municipio.nombre_municipio == municipio_filter)
-            
-            # Agrupar por municipio y estatus
-            results = query.group_by(Municipio.nombre_municipio, Turno.estatus).all()
+                id_municipio = catalog_cache.id_por_nombre('municipio', municipio_filter)
+            if municipio_filter and municipio_filter != 'todos' and id_municipio is None:
+                results = []
+            else:
+                results = turno_stats.leer(db, id_municipio)
             
-            # Obtener lista de todos los municipios para el filtro
-            municipios = db.query(Municipio.nombre_municipio).distinct().all()
-            municipios_list = [m.nombre_municipio for m in municipios]
+            # Lista de todos los municipios para el filtro (desde la caché)
+            municipios_list = [m['name'] for m in catalog_cache.items('municipio')]
             
             # Organizar datos para las gráficas
             stats_by_municipio = {}
             total_pendiente = 0
             total_resuelto = 0
             
-            for municipio, estatus, count in results:
+            for id_mun, estatus, count in results:
+                municipio = catalog_cache.nombre_por_id('municipio', id_mun)
+                if municipio is None:
+                    continue
                 if municipio not in stats_by_municipio:
                     stats_by_municipio[municipio] = {'Pendiente': 0, 'Resuelto': 0}
                 stats_by_municipio[municipio][estatus] = count
@@ -438,23 +1088,130 @@ def dashboard_stats():
         return jsonify({'success': False, 'error': str(e)}), 500
 
 
-_CATALOG_MAP = {
-    'nivel': {
-        'model': Nivel,
-        'pk': 'id_nivel',
-        'name_field': 'nombre_nivel'
-    },
-    'municipio': {
-        'model': Municipio,
-        'pk': 'id_municipio',
-        'name_field': 'nombre_municipio'
-    },
-    'asunto': {
-        'model': Asunto,
-        'pk': 'id_asunto',
-        'name_field': 'nombre_asunto'
-    }
+@app.route('/api/admin/stats/reconciliar', methods=['POST'])
+@require_admin
+def reconciliar_stats():
+    """Recalcula los contadores del dashboard desde la tabla de turnos."""
+    try:
+        with orm_session() as db:
+            corregidas = turno_stats.reconciliar(db)
+        return jsonify({'success': True, 'corregidas': corregidas})
+    except Exception as e:
+        print('Error en reconciliar_stats:', e)
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+
+_SERIE_PASOS = {
+    'hour': timedelta(hours=1),
+    'day': timedelta(days=1),
+    'week': timedelta(weeks=1),
 }
+SERIE_MAX_PUNTOS = 10000
+
+
+def _inicio_bucket(fecha, bucket):
+    """Inicio del intervalo (hora, día o semana que empieza en lunes) de `fecha`."""
+    if bucket == 'hour':
+        return fecha.replace(minute=0, second=0, microsecond=0)
+    dia = fecha.replace(hour=0, minute=0, second=0, microsecond=0)
+    if bucket == 'week':
+        dia -= timedelta(days=dia.weekday())
+    return dia
+
+
+@app.route('/api/admin/stats/series', methods=['GET'])
+@require_admin
+def stats_series():
+    """Turnos registrados por hora/día/semana en un rango de fechas, agrupados
+    por municipio, nivel o asunto. Lee la tabla acumulada por hora
+    (turno_stats_hora), así que el costo depende del rango y no del volumen.
+    Parámetros: desde, hasta (YYYY-MM-DD, inclusivos; por defecto los últimos
+    30 días), bucket (hour|day|week), group (municipio|nivel|asunto) y municipio."""
+    try:
+        bucket = request.args.get('bucket', 'day')
+        grupo = request.args.get('group', 'municipio')
+        if bucket not in _SERIE_PASOS:
+            return jsonify({'success': False, 'error': 'bucket debe ser hour, day o week'}), 400
+        if grupo not in _CATALOG_MAP:
+            return jsonify({'success': False, 'error': 'group debe ser municipio, nivel o asunto'}), 400
+
+        try:
+            hasta = _parse_fecha(request.args['hasta']) if request.args.get('hasta') else \
+                datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+            desde = _parse_fecha(request.args['desde']) if request.args.get('desde') else hasta - timedelta(days=29)
+        except ValueError as e:
+            return jsonify({'success': False, 'error': str(e)}), 400
+        hasta += timedelta(days=1)
+        if desde >= hasta:
+            return jsonify({'success': False, 'error': 'desde debe ser anterior a hasta'}), 400
+
+        paso = _SERIE_PASOS[bucket]
+        labels = []
+        actual = _inicio_bucket(desde, bucket)
+        while actual < hasta:
+            labels.append(actual)
+            actual += paso
+            if len(labels) > SERIE_MAX_PUNTOS:
+                return jsonify({'success': False, 'error': 'Rango demasiado grande para ese bucket'}), 400
+        posicion = {label: i for i, label in enumerate(labels)}
+
+        id_municipio = None
+        municipio = request.args.get('municipio')
+        if municipio and municipio != 'todos':
+            id_municipio = catalog_cache.id_por_nombre('municipio', municipio)
+            if id_municipio is None:
+                return jsonify({'success': False, 'error': 'Municipio inválido'}), 400
+
+        with orm_session() as db:
+            totales = turno_stats.serie_por_hora(db, desde, hasta, grupo, id_municipio)
+
+        series = {}
+        for (bucket_hora, id_dim), total in totales.items():
+            nombre = catalog_cache.nombre_por_id(grupo, id_dim) or f'Sin {grupo}'
+            valores = series.setdefault(nombre, [0] * len(labels))
+            valores[posicion[_inicio_bucket(bucket_hora, bucket)]] += total
+
+        return jsonify({
+            'success': True,
+            'bucket': bucket,
+            'group': grupo,
+            'labels': [label.isoformat() for label in labels],
+            'series': series,
+            'total': sum(sum(v) for v in series.values())
+        })
+    except Exception as e:
+        print('Error en stats_series:', e)
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+
+# Los catálogos públicos pueden cachearse en el navegador/proxy este tiempo;
+# pasado ese tiempo se revalidan con If-None-Match (304 sin cuerpo)
+CATALOG_MAX_AGE = int(os.getenv('CATALOG_MAX_AGE', '60'))
+
+
+def _respuesta_cacheable(payload, etag, cache_control):
+    """JSON con ETag y Cache-Control; responde 304 si el cliente ya tiene esa versión."""
+    if request.if_none_match.contains(etag):
+        resp = app.response_class(status=304)
+    else:
+        resp = jsonify(payload)
+    resp.set_etag(etag)
+    resp.headers['Cache-Control'] = cache_control
+    return resp
+
+
+@app.route('/api/public/catalogs', methods=['GET'])
+def public_catalogs_all():
+    """Los tres catálogos en una sola respuesta (un viaje por carga de formulario)."""
+    try:
+        return _respuesta_cacheable(
+            {'success': True, 'catalogs': {cat: catalog_cache.items(cat) for cat in _CATALOG_MAP}},
+            catalog_cache.etag(),
+            f'public, max-age={CATALOG_MAX_AGE}'
+        )
+    except Exception as e:
+        print('Error en public_catalogs_all:', e)
+        return jsonify({'success': False, 'error': str(e)}), 500
 
 
 @app.route('/api/public/catalogs/<string:cat>', methods=['GET'])
@@ -464,15 +1221,12 @@ def public_catalogs(cat):
     if cat not in _CATALOG_MAP:
         return jsonify({'success': False, 'error': 'Catálogo inválido'}), 400
 
-    cfg = _CATALOG_MAP[cat]
-    Model = cfg['model']
-    name_field = cfg['name_field']
-
     try:
-        with orm_session() as db:
-            items = db.query(Model).order_by(getattr(Model, name_field)).all()
-            out = [{'id': getattr(i, cfg['pk']), 'name': getattr(i, name_field)} for i in items]
-            return jsonify({'success': True, 'items': out})
+        return _respuesta_cacheable(
+            {'success': True, 'items': catalog_cache.items(cat)},
+            catalog_cache.etag(cat),
+            f'public, max-age={CATALOG_MAX_AGE}'
+        )
     except Exception as e:
         print('Error en public_catalogs:', e)
         return jsonify({'success': False, 'error': str(e)}), 500
@@ -493,9 +1247,12 @@ def catalogs_collection(cat):
     try:
         with orm_session() as db:
             if request.method == 'GET':
-                items = db.query(Model).order_by(getattr(Model, name_field)).all()
-                out = [{'id': getattr(i, cfg['pk']), 'name': getattr(i, name_field)} for i in items]
-                return jsonify({'success': True, 'items': out})
+                # El panel siempre revalida para ver de inmediato sus propios cambios
+                return _respuesta_cacheable(
+                    {'success': True, 'items': catalog_cache.items(cat)},
+                    catalog_cache.etag(cat),
+                    'private, no-cache'
+                )
 
             # POST -> crear
             data = request.get_json() or {}
@@ -509,6 +1266,7 @@ def catalogs_collection(cat):
             obj = Model(**{name_field: name})
             db.add(obj)
             db.flush()
+            catalog_cache.bump(db, cat)
             return jsonify({'success': True, 'item': {'id': getattr(obj, cfg['pk']), 'name': getattr(obj, name_field)}})
 
     except Exception as e:
@@ -536,6 +1294,7 @@ def catalogs_item(cat, obj_id):
 
             if request.method == 'DELETE':
                 db.delete(obj)
+                catalog_cache.bump(db, cat)
                 return jsonify({'success': True})
 
             # PUT -> update
@@ -544,12 +1303,108 @@ def catalogs_item(cat, obj_id):
             if not name:
                 return jsonify({'success': False, 'error': 'Falta nombre'}), 400
             setattr(obj, name_field, name)
+            catalog_cache.bump(db, cat)
             return jsonify({'success': True, 'item': {'id': getattr(obj, pk), 'name': getattr(obj, name_field)}})
 
     except Exception as e:
         print('Error en catalogs_item:', e)
         return jsonify({'success': False, 'error': str(e)}), 500
 
+def _encolar_pdf(turno_id, turno_data):
+    """Encola el PDF del turno salvo que ya exista uno con los mismos datos.
+    Devuelve el id del trabajo (nombre del archivo sin extensión)."""
+    job_id = pdf_cache.key(turno_id, turno_data)
+    if PDF_STREAM:
+        return job_id
+    if not pdf_cache.get(job_id):
+        pdf_jobs.submit(job_id, turno_data)
+    pdf_cache.maybe_evict()
+    return job_id
+
+
+def _pdf_url(turno_id, job_id):
+    """URL del PDF según el modo: archivo estático o streaming en memoria
+    (con un token firmado de corta duración en lugar de la CURP)."""
+    if PDF_STREAM:
+        return url_for('turno_pdf', turno_id=turno_id, token=pdf_tokens.dumps(turno_id))
+    return f'/static/pdfs/{job_id}.pdf'
+
+
+def _pdf_job_info(job_id, pdf_url=None):
+    """Datos de un trabajo de PDF para las respuestas JSON."""
+    if PDF_STREAM and pdf_url:
+        return {'id': job_id, 'status': 'ready', 'status_url': None, 'pdf_url': pdf_url}
+    return {
+        'id': job_id,
+        'status': pdf_jobs.status(job_id),
+        'status_url': url_for('pdf_job_status', job_id=job_id),
+        'pdf_url': f'/static/pdfs/{job_id}.pdf'
+    }
+
+
+@app.route('/api/pdf-jobs/<string:job_id>', methods=['GET'])
+def pdf_job_status(job_id):
+    """Estado de generación de un PDF; el cliente consulta hasta que esté 'ready'."""
+    if not re.fullmatch(r'turno_\d+(_\w+)?', job_id):
+        return jsonify({'success': False, 'error': 'Trabajo inválido'}), 400
+    return jsonify({'success': True, 'job': _pdf_job_info(job_id)})
+
+
+@app.route('/api/turno/<int:turno_id>/pdf', methods=['GET'])
+def turno_pdf(turno_id):
+    """Genera el comprobante en memoria y lo envía sin pasar por disco.
+    Requiere el token de _pdf_url (firmado sobre el id del turno, vence a los
+    PDF_TOKEN_MAX_AGE segundos) o sesión de administrador. Con If-None-Match
+    igual al ETag (hash del contenido) responde 304 sin regenerar el PDF. No
+    se envía Last-Modified: fecha_registro no cambia al editar la persona o
+    los catálogos, y If-Modified-Since devolvería un PDF desactualizado."""
+    if session.get('role') != 'admin':
+        token = request.args.get('token', '')
+        if not token:
+            return jsonify({'success': False, 'error': 'Se requiere token'}), 400
+        try:
+            valido = pdf_tokens.loads(token, max_age=PDF_TOKEN_MAX_AGE) == turno_id
+        except BadSignature:  # incluye SignatureExpired
+            valido = False
+        if not valido:
+            return jsonify({'success': False, 'error': 'Enlace inválido o vencido'}), 403
+
+    try:
+        with orm_session() as db:
+            turno = db.query(Turno).filter(Turno.id == turno_id).first()
+            if not turno:
+                return jsonify({'success': False, 'error': 'Turno no encontrado'}), 404
+
+            turno_data = {
+                'numero_turno': turno.numero_turno,
+                'municipio': catalog_cache.nombre_por_id('municipio', turno.id_municipio) or '',
+                'curp': turno.persona.curp,
+                'nombre_completo': turno.persona.nombre_completo,
+                'nombre': turno.persona.nombre,
+                'paterno': turno.persona.paterno,
+                'materno': turno.persona.materno,
+                'nivel': catalog_cache.nombre_por_id('nivel', turno.id_nivel) or '',
+                'asunto': catalog_cache.nombre_por_id('asunto', turno.id_asunto) or '',
+                'fecha_registro': turno.fecha_registro
+            }
+
+        etag = PDFCache.digest(turno_data)
+        if request.if_none_match.contains(etag):
+            return '', 304, {'ETag': f'"{etag}"'}
+
+        pdf_bytes = pdf_generator.render_ticket_pdf(turno_data)
+        return send_file(
+            io.BytesIO(pdf_bytes),
+            mimetype='application/pdf',
+            download_name=f'turno_{turno_data["numero_turno"]}.pdf',
+            etag=etag,
+            max_age=0
+        )
+    except Exception as e:
+        print('Error en turno_pdf:', e)
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+
 @app.route('/api/turno', methods=['POST'])
 def api_create_turno():
     """Crea un turno usando ORM y genera PDF; devuelve JSON con datos y url del pdf."""
@@ -562,79 +1417,80 @@ def api_create_turno():
                 return jsonify({'success': False, 'error': f'Falta campo {f}'}), 400
 
         with orm_session() as db:
-            # buscar o crear persona
-            persona = db.query(Persona).filter(Persona.curp == data['curp'].upper()).first()
-            if not persona:
-                persona = Persona(
-                    nombre_completo=data['nombreCompleto'],
-                    curp=data['curp'].upper(),
-                    nombre=data['nombre'],
-                    paterno=data['paterno'],
-                    materno=data['materno'],
-                    telefono=data['telefono'],
-                    celular=data['celular'],
-                    correo=data['correo']
-                )
-                db.add(persona)
-                db.flush()  # para tener id_persona
+            # obtener ids de catálogos (caché en memoria, sin consultas)
+            id_nivel = catalog_cache.id_por_nombre('nivel', data['nivel'])
+            id_municipio = catalog_cache.id_por_nombre('municipio', data['municipio'])
+            id_asunto = catalog_cache.id_por_nombre('asunto', data['asunto'])
 
-            # obtener ids de catálogos
-            nivel = db.query(Nivel).filter(Nivel.nombre_nivel.ilike(data['nivel'])).first()
-            municipio = db.query(Municipio).filter(Municipio.nombre_municipio.ilike(data['municipio'])).first()
-            asunto = db.query(Asunto).filter(Asunto.nombre_asunto.ilike(data['asunto'])).first()
-
-            if not nivel or not municipio or not asunto:
+            if not id_nivel or not id_municipio or not id_asunto:
                 return jsonify({'success': False, 'error': 'Nivel/Municipio/Asunto no válidos'}), 400
 
-            # Calcular numero_turno: obtén max por municipio
-            max_num = db.query(func.coalesce(func.max(Turno.numero_turno), 0)).filter(Turno.id_municipio == municipio.id_municipio).scalar()
-            numero_turno = int(max_num) + 1
+            nombre_nivel = catalog_cache.nombre_por_id('nivel', id_nivel)
+            nombre_municipio = catalog_cache.nombre_por_id('municipio', id_municipio)
+            nombre_asunto = catalog_cache.nombre_por_id('asunto', id_asunto)
+
+            # Reservar numero_turno en el contador del municipio (O(1), sin colisiones).
+            # Se hace antes de escribir en la sesión para no solapar candados.
+            numero_turno = turno_sequence.next_number(id_municipio)
+
+            # alta de la persona por CURP; si ya existe se usa tal cual está guardada
+            curp = data['curp'].upper()
+            id_persona, persona = persona_repository.obtener_o_crear(db, curp, {
+                'nombre_completo': data['nombreCompleto'],
+                'nombre': data['nombre'],
+                'paterno': data['paterno'],
+                'materno': data['materno'],
+                'telefono': data['telefono'],
+                'celular': data['celular'],
+                'correo': data['correo']
+            })
 
             # crear turno
             turno = Turno(
                 numero_turno=numero_turno,
-                id_persona=persona.id_persona,
-                id_nivel=nivel.id_nivel,
-                id_municipio=municipio.id_municipio,
-                id_asunto=asunto.id_asunto,
-                user_id=1  # temporal: administra
+                id_persona=id_persona,
+                id_nivel=id_nivel,
+                id_municipio=id_municipio,
+                id_asunto=id_asunto,
+                user_id=1,  # temporal: administra
+                # Explícita: es la misma que usan los contadores por hora
+                fecha_registro=datetime.now().replace(microsecond=0)
             )
             db.add(turno)
             db.flush()
+            event_bus.publicar_al_confirmar(db, 'turno_creado', {
+                'id': turno.id, 'numero_turno': turno.numero_turno,
+                'municipio': nombre_municipio, 'estatus': 'Pendiente'
+            })
 
             # preparar datos de salida
             turno_data = {
                 'id': turno.id,
                 'numero_turno': turno.numero_turno,
-                'nombre_completo': persona.nombre_completo,
-                'curp': persona.curp,
-                'telefono': persona.telefono,
-                'correo': persona.correo,
-                'nombre_nivel': nivel.nombre_nivel,
-                'nombre_municipio': municipio.nombre_municipio,
-                'nombre_asunto': asunto.nombre_asunto,
+                'nombre_completo': persona['nombre_completo'],
+                'curp': curp,
+                'telefono': persona['telefono'],
+                'correo': persona['correo'],
+                'nombre_nivel': nombre_nivel,
+                'nombre_municipio': nombre_municipio,
+                'nombre_asunto': nombre_asunto,
                 'fecha_registro': turno.fecha_registro
             }
 
-            # Generar PDF
-            pdf_dir = os.path.join(app.static_folder, 'pdfs')
-            os.makedirs(pdf_dir, exist_ok=True)
-            pdf_filename = f'turno_{turno.id}.pdf'
-            pdf_path = os.path.join(pdf_dir, pdf_filename)
-            pdf_generator.generate_ticket_pdf({
-                'numero_turno': turno.numero_turno,
-                'municipio': municipio.nombre_municipio,
-                'curp': persona.curp,
-                'nombre_completo': persona.nombre_completo,
-                'nombre': persona.nombre,
-                'paterno': persona.paterno,
-                'materno': persona.materno,
-                'nivel': nivel.nombre_nivel,
-                'asunto': asunto.nombre_asunto,
-                'fecha_registro': turno.fecha_registro
-            }, pdf_path)
-
-            return jsonify({'success': True, 'turno': turno_data, 'pdf_url': f'/static/pdfs/{pdf_filename}'})
+            # Encolar PDF: la respuesta no espera el render
+            pdf_job = _encolar_pdf(turno.id, dict(
+                persona,
+                numero_turno=turno.numero_turno,
+                municipio=nombre_municipio,
+                curp=curp,
+                nivel=nombre_nivel,
+                asunto=nombre_asunto,
+                fecha_registro=turno.fecha_registro
+            ))
+
+            pdf_url = _pdf_url(turno.id, pdf_job)
+            return jsonify({'success': True, 'turno': turno_data, 'pdf_url': pdf_url,
+                            'pdf_job': _pdf_job_info(pdf_job, pdf_url)})
 
     except Exception as e:
         print('Error en api_create_turno:', e)
@@ -839,5 +1695,22 @@ def update_user_role(user_id):
         return jsonify({'success': False, 'error': str(e)}), 500
 
 
+@app.cli.command('reindexar-personas')
+def reindexar_personas_command():
+    """Recalcula el nombre normalizado de búsqueda de todas las personas."""
+    with orm_session() as db:
+        total = persona_search.reindexar(db)
+    print(f'Personas reindexadas: {total}')
+
+
+@app.cli.command('reconciliar-stats')
+def reconciliar_stats_command():
+    """Recalcula turno_stats desde turnos (inicialización o corrección de
+    desvíos; se puede programar con cron)."""
+    with orm_session() as db:
+        corregidas = turno_stats.reconciliar(db)
+    print(f'Contadores corregidos: {corregidas}')
+
+
 if __name__ == '__main__':
     app.run(debug=True)
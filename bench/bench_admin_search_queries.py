@@ -0,0 +1,142 @@
+"""Prueba de número de consultas de /api/admin/search-turnos (N+1).
+
+Cuenta las sentencias SQL de cada búsqueda con before_cursor_execute sobre
+el engine y verifica con assert que el número no depende del tamaño del
+resultado: 1 turno contra N turnos (por CURP, por nombre y con count=exact).
+Si alguien vuelve a leer persona o catálogos por fila, la prueba falla.
+Termina con código 1 si algo falla, así que sirve como prueba en CI.
+
+Uso: python bench/bench_admin_search_queries.py [--sqlite] [--n 50]
+Con --sqlite corre contra una base SQLite temporal; sin él usa la base
+configurada (DATABASE_URL / MYSQL_*). Crea los catálogos 'Consultas' si no
+existen y borra al final las personas con CURP 'QRY%' y sus turnos.
+"""
+import os
+import sys
+import argparse
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import event
+
+CATALOGO = 'Consultas'
+PREFIJO = 'QRY'
+CURP_UNO = f'{PREFIJO}UNO'.ljust(18, '0')
+CURP_VARIOS = f'{PREFIJO}VARIOS'.ljust(18, '0')
+
+
+def preparar(app_module, n):
+    """Persona 'QRYUNO' con 1 turno y persona 'QRYVARIOS' con n turnos;
+    además n personas 'Zacarias Consultado <i>' con un turno cada una."""
+    from model.models import Nivel, Municipio, Asunto, Persona, Turno, User, normalizar_nombre
+    db = app_module.SessionLocal()
+    cache = app_module.catalog_cache
+    ids = {}
+    for Model, campo, cat in ((Nivel, 'nombre_nivel', 'nivel'), (Municipio, 'nombre_municipio', 'municipio'),
+                              (Asunto, 'nombre_asunto', 'asunto')):
+        obj = db.query(Model).filter(getattr(Model, campo) == CATALOGO).first()
+        if obj is None:
+            obj = Model(**{campo: CATALOGO})
+            db.add(obj)
+            cache.bump(db, cat)
+            db.flush()
+        ids[cat] = getattr(obj, f'id_{cat}')
+    user = db.query(User).filter(User.username == 'consultas').first()
+    if user is None:
+        user = User(username='consultas', email='consultas@localhost', password_hash='-', role='admin')
+        db.add(user)
+        db.flush()
+
+    def persona(curp, nombre, turnos):
+        p = Persona(curp=curp, nombre_completo=nombre, nombre_busqueda=normalizar_nombre(nombre),
+                    nombre=nombre.split()[0], paterno='Consulta', materno='')
+        db.add(p)
+        db.flush()
+        for i in range(turnos):
+            db.add(Turno(numero_turno=100000 + i, id_persona=p.id_persona, id_nivel=ids['nivel'],
+                         id_municipio=ids['municipio'], id_asunto=ids['asunto'], user_id=user.id))
+
+    persona(CURP_UNO, 'Unico Solitario', 1)
+    persona(CURP_VARIOS, 'Varios Repetido', n)
+    for i in range(n):
+        persona(f'{PREFIJO}N{i:015d}', f'Zacarias Consultado {i}', 1)
+    db.commit()
+    db.close()
+
+
+def limpiar(app_module):
+    from model.models import Persona, Turno
+    db = app_module.SessionLocal()
+    # Por el ORM, para que los contadores del dashboard se descuenten
+    for turno in db.query(Turno).join(Persona, Persona.id_persona == Turno.id_persona) \
+            .filter(Persona.curp.like(f'{PREFIJO}%')):
+        db.delete(turno)
+    db.flush()
+    db.query(Persona).filter(Persona.curp.like(f'{PREFIJO}%')).delete(synchronize_session=False)
+    db.commit()
+    db.close()
+
+
+def contar(app_module, client, cuerpo):
+    """(sentencias SQL, número de turnos devueltos) de una búsqueda."""
+    sentencias = []
+
+    def registrar(conn, cursor, statement, parameters, context, executemany):
+        sentencias.append(statement)
+
+    event.listen(app_module.engine, 'before_cursor_execute', registrar)
+    try:
+        resp = client.post('/api/admin/search-turnos', json=cuerpo)
+    finally:
+        event.remove(app_module.engine, 'before_cursor_execute', registrar)
+    datos = resp.get_json()
+    assert resp.status_code == 200 and datos['success'], f'{cuerpo}: {resp.status_code} {datos}'
+    return len(sentencias), len(datos['turnos'])
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--sqlite', action='store_true', help='usar una base SQLite temporal')
+    parser.add_argument('--n', type=int, default=50)
+    args = parser.parse_args()
+
+    if args.sqlite:
+        os.environ['DATABASE_URL'] = f'sqlite:///{os.path.join(tempfile.mkdtemp(prefix="qry_"), "turnos.db")}'
+    import app as app_module  # después de fijar DATABASE_URL
+
+    limpiar(app_module)
+    preparar(app_module, args.n)
+    client = app_module.app.test_client()
+    with client.session_transaction() as s:
+        s['usuario'], s['role'], s['user_id'] = 'consultas', 'admin', 1
+
+    casos = (
+        ('curp', {'curp': CURP_UNO}, {'curp': CURP_VARIOS}),
+        ('nombre', {'nombre': 'Unico Solitario'}, {'nombre': 'Zacarias Consultado'}),
+        ('count=exact', {'curp': CURP_UNO, 'count': 'exact'},
+         {'nombre': 'Zacarias Consultado', 'count': 'exact'}),
+    )
+    fallos = 0
+    try:
+        # Calentamiento (caché de catálogos, detección de índices de búsqueda)
+        for _, uno, varios in casos:
+            contar(app_module, client, uno)
+            contar(app_module, client, varios)
+        # La caché de catálogos no vuelve a consultar versiones durante la prueba
+        app_module.catalog_cache.check_interval = float('inf')
+        for nombre, uno, varios in casos:
+            cuerpo_varios = dict(varios, limit=200)
+            c1, t1 = contar(app_module, client, dict(uno, limit=200))
+            cn, tn = contar(app_module, client, cuerpo_varios)
+            correcto = t1 == 1 and tn >= args.n and c1 == cn
+            fallos += not correcto
+            print(f'{nombre:<12} 1 turno: {c1} sentencias   {tn} turnos: {cn} sentencias   '
+                  f'{"OK" if correcto else "FALLO"}')
+    finally:
+        limpiar(app_module)
+    sys.exit(1 if fallos else 0)
+
+
+if __name__ == '__main__':
+    main()
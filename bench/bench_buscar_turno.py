@@ -0,0 +1,127 @@
+"""Benchmark de la consulta de turno por CURP + número (/api/buscar-turno).
+
+Carga N personas sintéticas con 1 a 3 turnos cada una (200,000 por defecto)
+en la base configurada (DATABASE_URL / MYSQL_*) y compara la ruta anterior
+(persona por CURP, turno por persona y número, y nivel/municipio/asunto por
+PK: cinco viajes) contra `_persona_y_turno` (un LEFT JOIN apoyado en el
+índice idx_persona_numero; los catálogos salen de la caché en memoria).
+
+Uso: python bench/bench_buscar_turno.py [--n 200000] [--sin-carga] [--repeticiones 2000]
+Los datos sintéticos usan CURP con prefijo 'SYN', el municipio 'Benchmark' y el
+usuario 'bench'; se borran con DELETE FROM turnos WHERE id_persona IN (SELECT
+id_persona FROM persona WHERE curp LIKE 'SYN%') y DELETE FROM persona WHERE
+curp LIKE 'SYN%'.
+"""
+import os
+import sys
+import time
+import random
+import argparse
+import statistics
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import insert, select, func
+
+from model.db_orm import SessionLocal, engine
+from model.models import Base, Persona, Turno, Nivel, Municipio, Asunto, User, normalizar_nombre
+from app import _persona_y_turno
+
+
+def _asegurar(db, Model, filtro, **valores):
+    obj = db.query(Model).filter_by(**filtro).first()
+    if obj is None:
+        obj = Model(**filtro, **valores)
+        db.add(obj)
+        db.commit()
+    return obj
+
+
+def cargar(n, lote=5000):
+    rnd = random.Random(42)
+    db = SessionLocal()
+    municipio = _asegurar(db, Municipio, {'nombre_municipio': 'Benchmark'})
+    user = _asegurar(db, User, {'username': 'bench'}, email='bench@localhost', password_hash='-')
+    id_municipio, user_id = municipio.id_municipio, user.id
+    inicial = db.query(func.count(Persona.id_persona)).filter(Persona.curp.like('SYN%')).scalar()
+    numero = db.query(func.coalesce(func.max(Turno.numero_turno), 0)).filter(
+        Turno.id_municipio == id_municipio).scalar()
+    db.close()
+
+    with engine.begin() as conn:
+        for base in range(inicial, n, lote):
+            curps = [f'SYN{i:015d}' for i in range(base, min(base + lote, n))]
+            conn.execute(insert(Persona), [
+                {'curp': curp, 'nombre_completo': f'Persona {curp}', 'nombre_busqueda': normalizar_nombre(f'Persona {curp}'),
+                 'nombre': 'Persona', 'paterno': curp, 'materno': ''}
+                for curp in curps
+            ])
+            ids = conn.execute(select(Persona.id_persona).where(Persona.curp.in_(curps))).scalars().all()
+            turnos = []
+            for id_persona in ids:
+                for _ in range(rnd.randint(1, 3)):
+                    numero += 1
+                    turnos.append({'numero_turno': numero, 'id_persona': id_persona,
+                                   'id_municipio': id_municipio, 'user_id': user_id})
+            conn.execute(insert(Turno), turnos)
+    print(f'personas sintéticas: {max(n, inicial)}')
+
+
+def muestras(db, k):
+    """Pares (curp, numero_turno) existentes al azar."""
+    rows = db.execute(
+        select(Persona.curp, Turno.numero_turno).join(Turno, Turno.id_persona == Persona.id_persona)
+        .where(Persona.curp.like('SYN%')).limit(50_000)
+    ).all()
+    return random.Random(7).choices(rows, k=k)
+
+
+def ruta_anterior(db, curp, numero_turno):
+    persona = db.query(Persona).filter(Persona.curp == curp).first()
+    turno = db.query(Turno).filter(
+        Turno.id_persona == persona.id_persona,
+        Turno.numero_turno == numero_turno
+    ).first()
+    db.get(Nivel, turno.id_nivel) if turno.id_nivel else None
+    db.get(Municipio, turno.id_municipio)
+    db.get(Asunto, turno.id_asunto) if turno.id_asunto else None
+    return turno
+
+
+def medir(fn, pares):
+    tiempos = []
+    for curp, numero_turno in pares:
+        db = SessionLocal()  # sesión nueva por consulta, como en cada petición
+        inicio = time.perf_counter()
+        fn(db, curp, numero_turno)
+        tiempos.append((time.perf_counter() - inicio) * 1000)
+        db.close()
+    tiempos.sort()
+    return statistics.median(tiempos), tiempos[int(len(tiempos) * 0.99) - 1]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--n', type=int, default=200_000)
+    parser.add_argument('--sin-carga', action='store_true')
+    parser.add_argument('--repeticiones', type=int, default=2000)
+    args = parser.parse_args()
+
+    Base.metadata.create_all(bind=engine)
+    if not args.sin_carga:
+        cargar(args.n)
+
+    db = SessionLocal()
+    pares = muestras(db, args.repeticiones)
+    db.close()
+
+    medir(ruta_anterior, pares[:100])  # calentamiento
+    antes = medir(ruta_anterior, pares)
+    ahora = medir(lambda db, c, n: _persona_y_turno(db, c, n), pares)
+    print(f'{"ruta":<22} {"p50 ms":>8} {"p99 ms":>8}')
+    print(f'{"anterior (5 consultas)":<22} {antes[0]:8.3f} {antes[1]:8.3f}')
+    print(f'{"un JOIN":<22} {ahora[0]:8.3f} {ahora[1]:8.3f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,62 @@
+"""Microbenchmark de generación de comprobantes PDF.
+
+Compara tickets/segundo con la plantilla precompilada (compiled=True) contra
+construir todas las partes del comprobante en cada llamada (compiled=False),
+y el efecto de la caché de QR (tickets nuevos contra regenerados).
+
+Uso: python bench/bench_pdf.py [numero_de_tickets]
+"""
+import os
+import sys
+import time
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services.pdf_service import PDFGenerator
+from services.qr_service import qr_runs
+
+
+def ticket(i):
+    return {
+        'numero_turno': i,
+        'municipio': 'Saltillo',
+        'nivel': 'Primaria',
+        'asunto': 'Inscripción',
+        'curp': f'ABCD{i:06d}HDFXXX01',
+        'nombre_completo': f'Persona de Prueba {i}',
+        'nombre': 'Persona',
+        'paterno': 'de',
+        'materno': f'Prueba {i}',
+        'fecha_registro': datetime(2024, 11, 1, 9, 30),
+    }
+
+
+def medir(generator, n, rondas=3, qr_cache=False):
+    """Mejor tasa (tickets/s) de varias rondas, para reducir ruido.
+    Con qr_cache=False se vacía la caché de QR antes de cada ronda."""
+    generator.render_ticket_pdf(ticket(0))  # calentamiento
+    mejor = 0.0
+    for _ in range(rondas):
+        if not qr_cache:
+            qr_runs.cache_clear()
+        inicio = time.perf_counter()
+        for i in range(1, n + 1):
+            generator.render_ticket_pdf(ticket(i))
+        mejor = max(mejor, n / (time.perf_counter() - inicio))
+    return mejor
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    antes = medir(PDFGenerator(compiled=False), n)
+    despues = medir(PDFGenerator(compiled=True), n)
+    print(f'tickets: {n}')
+    print(f'sin plantilla:  {antes:8.1f} tickets/s')
+    print(f'con plantilla:  {despues:8.1f} tickets/s  ({despues / antes:.2f}x)')
+    regenerados = medir(PDFGenerator(compiled=True), n, qr_cache=True)
+    print(f'QR en caché:    {regenerados:8.1f} tickets/s  ({regenerados / antes:.2f}x)')
+
+
+if __name__ == '__main__':
+    main()
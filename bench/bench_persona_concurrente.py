@@ -0,0 +1,164 @@
+"""Prueba de concurrencia del alta de persona por CURP (POST /api/turno).
+
+Lanza N peticiones simultáneas con la misma CURP (hilos + test client de
+Flask) y verifica con assert:
+- CURP nueva: todas responden 200, queda una sola fila en persona, todos
+  los turnos apuntan a ella y cada respuesta trae los datos guardados.
+- CURP existente: los datos enviados desde el kiosco (nombre, teléfono,
+  correo) no reemplazan a los guardados.
+Termina con código 1 si algo falla, así que sirve como prueba en CI.
+
+Uso: python bench/bench_persona_concurrente.py [--sqlite] [--hilos 20] [--rondas 5]
+Con --sqlite corre contra una base SQLite temporal; sin él usa la base
+configurada (DATABASE_URL / MYSQL_*). Crea los catálogos 'Concurrencia' si
+no existen y borra al final las personas con CURP 'CNC%' y sus turnos.
+"""
+import os
+import sys
+import argparse
+import tempfile
+import threading
+from collections import Counter
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+CATALOGO = 'Concurrencia'
+PREFIJO = 'CNC'
+
+
+def _asegurar(db, Model, campo, nombre, catalog_cache, cat):
+    if db.query(Model).filter(getattr(Model, campo) == nombre).first() is None:
+        db.add(Model(**{campo: nombre}))
+        catalog_cache.bump(db, cat)
+
+
+def preparar(app_module):
+    from model.models import Nivel, Municipio, Asunto
+    db = app_module.SessionLocal()
+    cache = app_module.catalog_cache
+    _asegurar(db, Nivel, 'nombre_nivel', CATALOGO, cache, 'nivel')
+    _asegurar(db, Municipio, 'nombre_municipio', CATALOGO, cache, 'municipio')
+    _asegurar(db, Asunto, 'nombre_asunto', CATALOGO, cache, 'asunto')
+    db.commit()
+    db.close()
+
+
+def limpiar(app_module):
+    from model.models import Persona, Turno
+    db = app_module.SessionLocal()
+    # Por el ORM, para que los contadores del dashboard se descuenten
+    for turno in db.query(Turno).join(Persona, Persona.id_persona == Turno.id_persona) \
+            .filter(Persona.curp.like(f'{PREFIJO}%')):
+        db.delete(turno)
+    db.flush()
+    db.query(Persona).filter(Persona.curp.like(f'{PREFIJO}%')).delete(synchronize_session=False)
+    db.commit()
+    db.close()
+
+
+def enviar_en_paralelo(client_factory, curp, hilos):
+    """POST /api/turno simultáneos; cada hilo manda datos distintos.
+    Devuelve la lista de (status, json)."""
+    barrera = threading.Barrier(hilos)
+    respuestas = []
+    lock = threading.Lock()
+
+    def enviar(i):
+        client = client_factory()
+        datos = {'nombreCompleto': f'Kiosco {i}', 'curp': curp, 'nombre': 'Kiosco',
+                 'paterno': str(i), 'materno': 'X', 'telefono': f'{i:010d}',
+                 'celular': f'{i:010d}', 'correo': f'hilo{i}@kiosco.test',
+                 'nivel': CATALOGO, 'municipio': CATALOGO, 'asunto': CATALOGO}
+        barrera.wait()
+        resp = client.post('/api/turno', json=datos)
+        with lock:
+            respuestas.append((resp.status_code, resp.get_json(silent=True)))
+
+    threads = [threading.Thread(target=enviar, args=(i,)) for i in range(hilos)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return respuestas
+
+
+def guardada(app_module, curp):
+    from sqlalchemy import select, func
+    from model.models import Persona, Turno
+    db = app_module.SessionLocal()
+    try:
+        personas = db.query(Persona).filter(Persona.curp == curp).all()
+        turnos, distintas = db.execute(
+            select(func.count(Turno.id), func.count(func.distinct(Turno.id_persona)))
+            .join(Persona, Persona.id_persona == Turno.id_persona)
+            .where(Persona.curp == curp)
+        ).one()
+        datos = [(p.nombre_completo, p.telefono, p.correo) for p in personas]
+        return datos, turnos, distintas
+    finally:
+        db.close()
+
+
+def ronda_curp_nueva(app_module, curp, hilos):
+    respuestas = enviar_en_paralelo(app_module.app.test_client, curp, hilos)
+    codigos = Counter(r[0] for r in respuestas)
+    assert codigos == Counter({200: hilos}), f'{curp}: respuestas {dict(codigos)}'
+    datos, turnos, distintas = guardada(app_module, curp)
+    assert len(datos) == 1, f'{curp}: {len(datos)} filas en persona'
+    assert (turnos, distintas) == (hilos, 1), f'{curp}: {turnos} turnos en {distintas} personas'
+    nombres = {r[1]['turno']['nombre_completo'] for r in respuestas}
+    assert nombres == {datos[0][0]}, f'{curp}: respuestas con datos distintos a los guardados {nombres}'
+
+
+def ronda_curp_existente(app_module, curp, hilos):
+    from model.models import Persona, normalizar_nombre
+    db = app_module.SessionLocal()
+    db.add(Persona(curp=curp, nombre_completo='Registro Original', nombre_busqueda=normalizar_nombre('Registro Original'),
+                   nombre='Registro', paterno='Original', materno='', telefono='1111111111',
+                   celular='1111111111', correo='original@registro.test'))
+    db.commit()
+    db.close()
+    respuestas = enviar_en_paralelo(app_module.app.test_client, curp, hilos)
+    codigos = Counter(r[0] for r in respuestas)
+    assert codigos == Counter({200: hilos}), f'{curp}: respuestas {dict(codigos)}'
+    datos, turnos, distintas = guardada(app_module, curp)
+    assert datos == [('Registro Original', '1111111111', 'original@registro.test')], \
+        f'{curp}: el kiosco modificó la persona existente: {datos}'
+    assert (turnos, distintas) == (hilos, 1), f'{curp}: {turnos} turnos en {distintas} personas'
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--sqlite', action='store_true', help='usar una base SQLite temporal')
+    parser.add_argument('--hilos', type=int, default=20)
+    parser.add_argument('--rondas', type=int, default=5)
+    args = parser.parse_args()
+
+    tmp = tempfile.mkdtemp(prefix='cnc_')
+    if args.sqlite:
+        os.environ['DATABASE_URL'] = f'sqlite:///{os.path.join(tmp, "turnos.db")}'
+    import app as app_module  # después de fijar DATABASE_URL
+    # Los PDF de la prueba se generan en línea y fuera de static/pdfs
+    app_module.pdf_jobs.workers = 0
+    app_module.pdf_jobs.pdf_dir = app_module.pdf_cache.directory = os.path.join(tmp, 'pdfs')
+
+    preparar(app_module)
+    limpiar(app_module)
+    fallos = 0
+    try:
+        for r in range(args.rondas):
+            for nombre, prueba in (('nueva', ronda_curp_nueva), ('existente', ronda_curp_existente)):
+                curp = f'{PREFIJO}{nombre[0].upper()}{os.getpid() % 10000:04d}{r:010d}'
+                try:
+                    prueba(app_module, curp, args.hilos)
+                    print(f'{curp}  CURP {nombre:<9}  OK')
+                except AssertionError as e:
+                    fallos += 1
+                    print(f'{curp}  CURP {nombre:<9}  FALLO: {e}')
+    finally:
+        limpiar(app_module)
+    sys.exit(1 if fallos else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,87 @@
+"""Benchmark de búsqueda de personas por nombre sobre un conjunto sintético.
+
+Carga N personas sintéticas (1,000,000 por defecto) en la base configurada
+(DATABASE_URL / MYSQL_*) y compara la búsqueda anterior
+(`nombre_completo ILIKE '%texto%'`, recorre toda la tabla) contra
+`persona_search.filtrar_por_nombre` (FULLTEXT ngram en MySQL).
+
+Uso: python bench/bench_persona_search.py [--n 1000000] [--sin-carga] [--repeticiones 20]
+Las personas sintéticas usan CURP con prefijo 'SYN' y se pueden borrar con
+DELETE FROM persona WHERE curp LIKE 'SYN%'.
+"""
+import os
+import sys
+import time
+import random
+import argparse
+import statistics
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import insert, func
+
+from model.db_orm import SessionLocal, engine
+from model.models import Base, Persona, normalizar_nombre
+from services import persona_search
+
+NOMBRES = ['José', 'María', 'Juan', 'Ana', 'Luis', 'Sofía', 'Ángel', 'Lucía', 'Jesús', 'Mónica',
+           'Raúl', 'Verónica', 'Héctor', 'Inés', 'Óscar', 'Begoña', 'Iñaki', 'Noé', 'Judith', 'Rubén']
+APELLIDOS = ['García', 'Hernández', 'Martínez', 'López', 'González', 'Pérez', 'Rodríguez', 'Sánchez',
+             'Ramírez', 'Cruz', 'Muñoz', 'Gómez', 'Díaz', 'Núñez', 'Ibáñez', 'Peña', 'Ortíz', 'Güemes',
+             'Castañeda', 'Valdés', 'Zúñiga', 'Acuña', 'Treviño', 'Villarreal', 'Cárdenas']
+BUSQUEDAS = ['jose munoz', 'Zúñiga', 'maria pena', 'treviño', 'INES valdes', 'castaneda ruben']
+
+
+def cargar(n, lote=5000):
+    rnd = random.Random(42)
+    inicial = SessionLocal().query(func.count(Persona.id_persona)).filter(Persona.curp.like('SYN%')).scalar()
+    with engine.begin() as conn:
+        for base in range(inicial, n, lote):
+            filas = []
+            for i in range(base, min(base + lote, n)):
+                nombre, paterno, materno = rnd.choice(NOMBRES), rnd.choice(APELLIDOS), rnd.choice(APELLIDOS)
+                completo = f'{nombre} {paterno} {materno}'
+                filas.append({
+                    'curp': f'SYN{i:015d}', 'nombre_completo': completo, 'nombre_busqueda': normalizar_nombre(completo),
+                    'nombre': nombre, 'paterno': paterno, 'materno': materno,
+                })
+            conn.execute(insert(Persona), filas)
+    print(f'personas sintéticas: {max(n, inicial)}')
+
+
+def medir(fn, repeticiones):
+    tiempos = []
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        total = fn()
+        tiempos.append((time.perf_counter() - inicio) * 1000)
+    tiempos.sort()
+    return total, statistics.median(tiempos), tiempos[int(len(tiempos) * 0.99) - 1]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--n', type=int, default=1_000_000)
+    parser.add_argument('--sin-carga', action='store_true')
+    parser.add_argument('--repeticiones', type=int, default=20)
+    args = parser.parse_args()
+
+    Base.metadata.create_all(bind=engine)
+    if not args.sin_carga:
+        cargar(args.n)
+
+    db = SessionLocal()
+    print(f'{"búsqueda":<18} {"ILIKE p50/p99 ms":>20} {"índice p50/p99 ms":>20} {"filas":>8}')
+    for texto in BUSQUEDAS:
+        _, ilike_p50, ilike_p99 = medir(
+            lambda: db.query(Persona.id_persona).filter(Persona.nombre_completo.ilike(f'%{texto}%')).limit(50).count(),
+            args.repeticiones)
+        filas, idx_p50, idx_p99 = medir(
+            lambda: persona_search.filtrar_por_nombre(db.query(Persona.id_persona), texto).limit(50).count(),
+            args.repeticiones)
+        print(f'{texto:<18} {ilike_p50:9.2f}/{ilike_p99:<9.2f} {idx_p50:9.2f}/{idx_p99:<9.2f} {filas:>8}')
+    db.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -1,92 +1,177 @@
 import pymysql
+import pymysql.cursors
 import logging
 import os
+import queue
+import threading
+import time
+from contextlib import contextmanager
 
 logging.basicConfig(level=logging.INFO)
 
 class DB:
     """
-    Clase DB implementando el patrón de diseño Singleton.
-    Esto asegura que solo exista una instancia de la conexión a la base de datos
-    en toda la aplicación, optimizando recursos y evitando múltiples conexiones.
+    Capa de acceso a datos con SQL directo sobre pymysql.
+
+    Se mantiene el patrón Singleton, pero la instancia ya no comparte una
+    conexión ni un cursor: administra un pool de conexiones (LIFO) y cada
+    llamada toma una conexión del pool y abre su propio cursor, por lo que es
+    seguro usarla desde varios hilos de un servidor WSGI.
+
+    Variables de entorno: DB_RAW_POOL_SIZE (5), DB_RAW_POOL_TIMEOUT (30 s) y
+    DB_RAW_POOL_RECYCLE (1800 s). Los errores se registran y se propagan.
     """
     _instance = None
-    _conn = None
-    _cursor = None
-    
+    _lock = threading.Lock()
+
     def __new__(cls):
         """
         Implementación del patrón Singleton.
         Si no existe una instancia, crea una nueva. Si ya existe, retorna la misma.
         """
         if cls._instance is None:
-            cls._instance = super(DB, cls).__new__(cls)
-            cls._instance._initialize_connection()
+            with cls._lock:
+                if cls._instance is None:
+                    instance = super(DB, cls).__new__(cls)
+                    instance._initialize_pool()
+                    cls._instance = instance
         return cls._instance
-    
-    def _initialize_connection(self):
-        """Inicializa la conexión a la base de datos una sola vez."""
-        if self._conn is None:
+
+    def _initialize_pool(self):
+        """Prepara el pool vacío; las conexiones se abren bajo demanda."""
+        self.pool_size = int(os.getenv('DB_RAW_POOL_SIZE', '5'))
+        self.timeout = float(os.getenv('DB_RAW_POOL_TIMEOUT', '30'))
+        self.recycle = int(os.getenv('DB_RAW_POOL_RECYCLE', '1800'))
+        self._pid = os.getpid()
+        self._pool = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(self.pool_size)
+
+    def _connect(self):
+        conn = pymysql.connect(
+            host=os.getenv("MYSQL_HOST", "localhost"),
+            port=int(os.getenv("MYSQL_PORT", 3306)),
+            user=os.getenv("MYSQL_USER", "root"),
+            password=os.getenv("MYSQL_PASSWORD", "1234"),
+            db=os.getenv("MYSQL_DATABASE", "turnos_db"),
+            charset='utf8mb4',
+            autocommit=True,
+            cursorclass=pymysql.cursors.DictCursor
+        )
+        conn._creado = time.monotonic()
+        return conn
+
+    def _check_fork(self):
+        # Las conexiones heredadas de otro proceso (fork de gunicorn) no se reutilizan
+        if self._pid != os.getpid():
+            with self._lock:
+                if self._pid != os.getpid():
+                    self._initialize_pool()
+
+    @contextmanager
+    def connection(self):
+        """Toma una conexión del pool y la devuelve al terminar.
+        Si la conexión falla (error de red o de protocolo) se descarta."""
+        self._check_fork()
+        if not self._slots.acquire(timeout=self.timeout):
+            raise TimeoutError(f'No hay conexiones libres en el pool de BD (límite {self.pool_size})')
+        conn = None
+        try:
+            try:
+                conn = self._pool.get_nowait()
+                if time.monotonic() - conn._creado > self.recycle:
+                    self._discard(conn)
+                    conn = self._connect()
+            except queue.Empty:
+                conn = self._connect()
+            yield conn
+        except (pymysql.err.OperationalError, pymysql.err.InterfaceError):
+            if conn is not None:
+                self._discard(conn)
+                conn = None
+            raise
+        finally:
+            if conn is not None:
+                self._pool.put(conn)
+            self._slots.release()
+
+    @contextmanager
+    def transaction(self):
+        """Conexión con autocommit desactivado: commit al salir, rollback si hay error."""
+        with self.connection() as conn:
+            conn.autocommit(False)
             try:
-                self._conn = pymysql.connect(
-                    host=os.getenv("MYSQL_HOST", "localhost"),
-                    port=int(os.getenv("MYSQL_PORT", 3306)),
-                    user=os.getenv("MYSQL_USER", "root"),
-                    password=os.getenv("MYSQL_PASSWORD", "1234"),
-                    db=os.getenv("MYSQL_DATABASE", "turnos_db"),
-                    charset='utf8',
-                    autocommit=True,
-                    cursorclass=pymysql.cursors.DictCursor
-                )
-                self._cursor = self._conn.cursor()
-                logging.info("✅ Conexión a la base de datos establecida correctamente (Singleton).")
-            except Exception as e:
-                logging.error(f"❌ Error al conectar a la base de datos: {e}")
-    
-    @property
-    def conn(self):
-        """Retorna la conexión activa."""
-        if self._conn is None or not self._conn.open:
-            self._initialize_connection()
-        return self._conn
-    
-    @property
-    def cursor(self):
-        """Retorna el cursor activo."""
-        if self._cursor is None:
-            self._initialize_connection()
-        return self._cursor
+                yield conn
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+            finally:
+                conn.autocommit(True)
+
+    @staticmethod
+    def _discard(conn):
+        try:
+            conn.close()
+        except Exception:
+            pass
 
     def execute(self, query, params=None):
-        """ Ejecuta una consulta SQL, con o sin parámetros. """
-        if not self.conn:
-            logging.error("⚠️ No hay conexión activa para ejecutar consultas.")
-            return None
+        """ Ejecuta una sentencia SQL y devuelve el número de filas afectadas. """
         try:
-            self.cursor.execute(query, params)
-            return self.cursor
+            with self.connection() as conn, conn.cursor() as cursor:
+                return cursor.execute(query, params)
         except Exception as e:
             logging.error(f"❌ Error al ejecutar consulta: {e}")
-            return None
+            raise
+
+    def executemany(self, query, seq_params):
+        """ Ejecuta la sentencia para cada juego de parámetros en una transacción.
+        pymysql agrupa los INSERT ... VALUES en sentencias multi-fila. """
+        try:
+            with self.transaction() as conn, conn.cursor() as cursor:
+                return cursor.executemany(query, seq_params)
+        except Exception as e:
+            logging.error(f"❌ Error al ejecutar consulta masiva: {e}")
+            raise
 
     def fetch_all(self, query, params=None):
         """ Ejecuta una consulta y devuelve todos los resultados. """
-        cursor = self.execute(query, params)
-        return cursor.fetchall() if cursor else None
+        try:
+            with self.connection() as conn, conn.cursor() as cursor:
+                cursor.execute(query, params)
+                return cursor.fetchall()
+        except Exception as e:
+            logging.error(f"❌ Error al ejecutar consulta: {e}")
+            raise
 
     def fetch_one(self, query, params=None):
         """ Ejecuta una consulta y devuelve solo un registro. """
-        cursor = self.execute(query, params)
-        return cursor.fetchone() if cursor else None
-
-    def close(self):
-        """ Cierra todo correctamente. """
         try:
-            if self._cursor:
-                self._cursor.close()
-            if self._conn:
-                self._conn.close()
-            logging.info("🔒 Conexión cerrada correctamente.")
+            with self.connection() as conn, conn.cursor() as cursor:
+                cursor.execute(query, params)
+                return cursor.fetchone()
         except Exception as e:
-            logging.error(f"❌ Error al cerrar la conexión: {e}")
+            logging.error(f"❌ Error al ejecutar consulta: {e}")
+            raise
 
+    def iter_rows(self, query, params=None, batch=1000):
+        """ Recorre el resultado sin cargarlo completo en memoria (SSDictCursor).
+        La conexión queda ocupada hasta agotar o cerrar el generador. """
+        with self.connection() as conn:
+            with conn.cursor(pymysql.cursors.SSDictCursor) as cursor:
+                cursor.execute(query, params)
+                while True:
+                    rows = cursor.fetchmany(batch)
+                    if not rows:
+                        break
+                    yield from rows
+
+    def close(self):
+        """ Cierra todas las conexiones libres del pool. """
+        while True:
+            try:
+                conn = self._pool.get_nowait()
+            except queue.Empty:
+                break
+            self._discard(conn)
+        logging.info("🔒 Conexiones cerradas correctamente.")
@@ -1,14 +1,118 @@
 import os
-from sqlalchemy import create_engine
+import time
+import threading
+from sqlalchemy import create_engine, exc
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import QueuePool
 
 DB_URL = os.getenv('DATABASE_URL') or (
     f"mysql+pymysql://{os.getenv('MYSQL_USER','root')}:{os.getenv('MYSQL_PASSWORD','1234')}@{os.getenv('MYSQL_HOST','localhost')}:{os.getenv('MYSQL_PORT','3306')}/{os.getenv('MYSQL_DATABASE','turnos_db')}?charset=utf8mb4"
 )
 
-engine = create_engine(DB_URL, pool_pre_ping=True)
+
+def _env_bool(nombre, default):
+    valor = os.getenv(nombre)
+    if valor is None or valor == '':
+        return default
+    return valor.strip().lower() in ('1', 'true', 'yes', 'si', 'sí', 'on')
+
+
+class InstrumentedQueuePool(QueuePool):
+    """QueuePool que mide cuánto espera cada checkout por una conexión
+    (incluye abrir una conexión nueva cuando el pool está vacío)."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._stats_lock = threading.Lock()
+        self._local = threading.local()
+        self.checkouts = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+        self.timeouts = 0
+
+    def _do_get(self):
+        # QueuePool._do_get se llama a sí mismo al reintentar; solo se mide
+        # la llamada externa
+        if getattr(self._local, 'midiendo', False):
+            return super()._do_get()
+        self._local.midiendo = True
+        inicio = time.perf_counter()
+        try:
+            return super()._do_get()
+        except exc.TimeoutError:
+            with self._stats_lock:
+                self.timeouts += 1
+            raise
+        finally:
+            self._local.midiendo = False
+            espera = time.perf_counter() - inicio
+            with self._stats_lock:
+                self.checkouts += 1
+                self.wait_total += espera
+                self.wait_max = max(self.wait_max, espera)
+
+    def reset_stats(self):
+        with self._stats_lock:
+            self.checkouts = 0
+            self.wait_total = 0.0
+            self.wait_max = 0.0
+            self.timeouts = 0
+
+
+def _engine_kwargs(url):
+    """Parámetros del pool según variables de entorno:
+
+    DB_POOL_SIZE (10), DB_MAX_OVERFLOW (10), DB_POOL_TIMEOUT (30 s),
+    DB_POOL_RECYCLE (1800 s; debe ser menor que wait_timeout de MySQL) y
+    DB_POOL_PRE_PING (1). Con DB_POOL_PRE_PING=0 no se hace el ping de cada
+    checkout y la vigencia de las conexiones depende solo de DB_POOL_RECYCLE.
+    """
+    kwargs = {'pool_pre_ping': _env_bool('DB_POOL_PRE_PING', True)}
+    if url.startswith('sqlite'):
+        # SQLite usa su propio pool; los parámetros de tamaño no aplican
+        return kwargs
+    kwargs.update(
+        poolclass=InstrumentedQueuePool,
+        pool_size=int(os.getenv('DB_POOL_SIZE', '10')),
+        max_overflow=int(os.getenv('DB_MAX_OVERFLOW', '10')),
+        pool_timeout=float(os.getenv('DB_POOL_TIMEOUT', '30')),
+        pool_recycle=int(os.getenv('DB_POOL_RECYCLE', '1800')),
+        pool_use_lifo=True,
+    )
+    return kwargs
+
+
+engine = create_engine(DB_URL, **_engine_kwargs(DB_URL))
 SessionLocal = sessionmaker(bind=engine, autoflush=False, autocommit=False)
 
+
+def pool_stats():
+    """Estado del pool del engine: conexiones en uso, overflow y tiempos de espera."""
+    pool = engine.pool
+    stats = {'pool_class': type(pool).__name__, 'pid': os.getpid()}
+    if isinstance(pool, QueuePool):
+        stats.update(
+            size=pool.size(),
+            checked_in=pool.checkedin(),
+            checked_out=pool.checkedout(),
+            overflow=pool.overflow(),
+            max_overflow=pool._max_overflow,
+            timeout=pool.timeout(),
+            recycle=pool._recycle,
+            pre_ping=pool._pre_ping,
+        )
+    if isinstance(pool, InstrumentedQueuePool):
+        with pool._stats_lock:
+            stats.update(
+                checkouts=pool.checkouts,
+                wait_total_ms=round(pool.wait_total * 1000, 3),
+                wait_avg_ms=round(pool.wait_total * 1000 / pool.checkouts, 3) if pool.checkouts else 0.0,
+                wait_max_ms=round(pool.wait_max * 1000, 3),
+                timeouts=pool.timeouts,
+            )
+    return stats
+
+
 def get_session():
     """Produce (cede) una nueva sesión de SQLAlchemy. 
     Úsese como un administrador de contexto: with get_session() as session:"""
@@ -1,4 +1,7 @@
-from sqlalchemy import Column, Integer, String, Enum, TIMESTAMP, ForeignKey, func
+import re
+import unicodedata
+
+from sqlalchemy import Column, Integer, String, Enum, DateTime, TIMESTAMP, ForeignKey, Index, func, event
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import relationship
 
@@ -45,11 +48,36 @@ class Persona(Base):
     telefono = Column(String(20))
     celular = Column(String(20))
     correo = Column(String(120))
+    # nombre_completo normalizado (sin acentos, minúsculas) para el índice FULLTEXT
+    nombre_busqueda = Column(String(120))
     created_at = Column(TIMESTAMP, server_default=func.current_timestamp())
 
 
+def normalizar_nombre(texto):
+    """Normaliza un nombre para búsqueda: sin acentos, diéresis ni tilde de la ñ,
+    minúsculas y solo letras/dígitos separados por un espacio
+    ('José  MUÑOZ' -> 'jose munoz'). Se aplica igual al guardar y al buscar."""
+    if not texto:
+        return ''
+    texto = unicodedata.normalize('NFD', texto.lower())
+    texto = ''.join(c for c in texto if not unicodedata.combining(c))
+    return ' '.join(re.findall(r'\w+', texto))
+
+
+@event.listens_for(Persona, 'before_insert')
+@event.listens_for(Persona, 'before_update')
+def _sincronizar_nombre_busqueda(mapper, connection, persona):
+    persona.nombre_busqueda = normalizar_nombre(persona.nombre_completo)
+
+
 class Turno(Base):
     __tablename__ = 'turnos'
+    __table_args__ = (
+        Index('idx_persona_numero', 'id_persona', 'numero_turno'),
+    )
+    # Carga en el flush los valores que pone el servidor (fecha_registro):
+    # en MySQL no hay RETURNING y los contadores por hora los necesitan
+    __mapper_args__ = {'eager_defaults': True}
     id = Column(Integer, primary_key=True, autoincrement=True)
     numero_turno = Column(Integer, nullable=False)
     id_persona = Column(Integer, ForeignKey('persona.id_persona'), nullable=False)
@@ -65,3 +93,35 @@ class Turno(Base):
     municipio = relationship('Municipio')
     asunto = relationship('Asunto')
     user = relationship('User')
+
+
+class TurnoSecuencia(Base):
+    """Contador del último número de turno asignado por municipio."""
+    __tablename__ = 'turno_secuencia'
+    id_municipio = Column(Integer, ForeignKey('municipio.id_municipio', ondelete='CASCADE'), primary_key=True)
+    ultimo = Column(Integer, nullable=False, default=0)
+
+
+class TurnoStats(Base):
+    """Número de turnos por municipio y estatus (lo mantiene services/turno_stats.py)."""
+    __tablename__ = 'turno_stats'
+    id_municipio = Column(Integer, ForeignKey('municipio.id_municipio', ondelete='CASCADE'), primary_key=True)
+    estatus = Column(Enum('Pendiente', 'Resuelto'), primary_key=True)
+    total = Column(Integer, nullable=False, default=0)
+
+
+class TurnoStatsHora(Base):
+    """Turnos registrados por hora, municipio, nivel y asunto (0 = sin nivel/asunto)."""
+    __tablename__ = 'turno_stats_hora'
+    bucket_hora = Column(DateTime, primary_key=True)
+    id_municipio = Column(Integer, ForeignKey('municipio.id_municipio', ondelete='CASCADE'), primary_key=True)
+    id_nivel = Column(Integer, primary_key=True, default=0)
+    id_asunto = Column(Integer, primary_key=True, default=0)
+    total = Column(Integer, nullable=False, default=0)
+
+
+class CatalogoVersion(Base):
+    """Versión de cada catálogo; se incrementa con cada alta, cambio o baja."""
+    __tablename__ = 'catalogo_version'
+    catalogo = Column(String(20), primary_key=True)
+    version = Column(Integer, nullable=False, default=0)
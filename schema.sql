@@ -1,4 +1,8 @@
 -- Asegurarnos de que la tabla turnos tiene la estructura correcta
+DROP TABLE IF EXISTS catalogo_version;
+DROP TABLE IF EXISTS turno_stats;
+DROP TABLE IF EXISTS turno_stats_hora;
+DROP TABLE IF EXISTS turno_secuencia;
 DROP TABLE IF EXISTS turnos;
 DROP TABLE IF EXISTS persona;
 DROP TABLE IF EXISTS nivel;
@@ -35,6 +39,13 @@ CREATE TABLE asunto (
   nombre_asunto VARCHAR(60) NOT NULL UNIQUE
 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
 
+-- Versión de cada catálogo: la aplicación la incrementa al modificarlo para
+-- invalidar la caché de catálogos de todos los procesos
+CREATE TABLE catalogo_version (
+  catalogo VARCHAR(20) PRIMARY KEY,
+  version INT NOT NULL DEFAULT 0
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
+
 -- 3) Tabla persona
 CREATE TABLE persona (
   id_persona INT AUTO_INCREMENT PRIMARY KEY,
@@ -46,7 +57,10 @@ CREATE TABLE persona (
   telefono VARCHAR(20),
   celular VARCHAR(20),
   correo VARCHAR(120),
-  created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+  -- nombre_completo sin acentos y en minúsculas (lo mantiene la aplicación)
+  nombre_busqueda VARCHAR(120),
+  created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+  FULLTEXT INDEX ft_persona_nombre (nombre_busqueda) WITH PARSER ngram
 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
 
 -- 4) Tabla turnos
@@ -66,32 +80,47 @@ CREATE TABLE turnos (
   FOREIGN KEY (id_asunto) REFERENCES asunto(id_asunto) ON DELETE SET NULL ON UPDATE CASCADE,
   FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE RESTRICT ON UPDATE CASCADE,
   INDEX idx_numero_municipio (numero_turno, id_municipio),
-  INDEX idx_id_persona (id_persona)
+  -- Consulta de turno por CURP + número (también sirve a la FK de id_persona)
+  INDEX idx_persona_numero (id_persona, numero_turno),
+  -- Paginación por cursor (fecha_registro, id); InnoDB agrega el PK al índice
+  INDEX idx_fecha_registro (fecha_registro)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
+
+-- 5) Contador de número de turno por municipio
+-- La aplicación reserva números con un UPDATE atómico sobre esta fila
+-- (ver services/turno_sequence.py) en lugar de calcular MAX(numero_turno)+1.
+CREATE TABLE turno_secuencia (
+  id_municipio INT PRIMARY KEY,
+  ultimo INT NOT NULL DEFAULT 0,
+  FOREIGN KEY (id_municipio) REFERENCES municipio(id_municipio) ON DELETE CASCADE ON UPDATE CASCADE
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
+
+-- 6) Agregados para el dashboard: turnos por municipio y estatus
+-- La aplicación los actualiza en la misma transacción que inserta, borra o
+-- cambia un turno (ver services/turno_stats.py); `flask reconciliar-stats`
+-- los recalcula desde turnos.
+CREATE TABLE turno_stats (
+  id_municipio INT NOT NULL,
+  estatus ENUM('Pendiente','Resuelto') NOT NULL,
+  total INT NOT NULL DEFAULT 0,
+  PRIMARY KEY (id_municipio, estatus),
+  FOREIGN KEY (id_municipio) REFERENCES municipio(id_municipio) ON DELETE CASCADE ON UPDATE CASCADE
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
+
+-- Turnos registrados por hora (series de tiempo del dashboard); nivel y
+-- asunto usan 0 cuando el turno no los tiene. La PK empieza por la hora para
+-- que un rango de fechas sea un recorrido acotado del índice.
+CREATE TABLE turno_stats_hora (
+  bucket_hora DATETIME NOT NULL,
+  id_municipio INT NOT NULL,
+  id_nivel INT NOT NULL DEFAULT 0,
+  id_asunto INT NOT NULL DEFAULT 0,
+  total INT NOT NULL DEFAULT 0,
+  PRIMARY KEY (bucket_hora, id_municipio, id_nivel, id_asunto),
+  FOREIGN KEY (id_municipio) REFERENCES municipio(id_municipio) ON DELETE CASCADE ON UPDATE CASCADE
 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
 
--- 5) Trigger para auto-incrementar número de turno por municipio
-DELIMITER $$
-
-CREATE TRIGGER trg_turnos_numero_before_insert
-BEFORE INSERT ON turnos
-FOR EACH ROW
-BEGIN
-    DECLARE next_number INT;
-    
-    -- Obtener el siguiente número de turno para el municipio
-    SELECT COALESCE(MAX(numero_turno), 0) + 1 INTO next_number
-    FROM turnos 
-    WHERE id_municipio = NEW.id_municipio;
-    
-    -- Si no se proporcionó número de turno o es 0, asignar el siguiente
-    IF NEW.numero_turno IS NULL OR NEW.numero_turno = 0 THEN
-        SET NEW.numero_turno = next_number;
-    END IF;
-END $$
-
-DELIMITER ;
-
--- 6) Datos iniciales
+-- 7) Datos iniciales
 -- Usuario administrador por defecto
 -- Usuario: admin / Contraseña: admin123
 INSERT INTO users (username, email, password_hash, role) VALUES
@@ -104,4 +133,8 @@ INSERT INTO municipio (nombre_municipio) VALUES
 ('Saltillo'), ('Torreón'), ('Monclova'), ('Matamoros');
 
 INSERT INTO asunto (nombre_asunto) VALUES
-('Inscripción'), ('Consulta'), ('Reporte'), ('Otro');
\ No newline at end of file
+('Inscripción'), ('Consulta'), ('Reporte'), ('Otro');
+
+-- Una fila por catálogo: bump() solo incrementa
+INSERT INTO catalogo_version (catalogo, version) VALUES
+('nivel', 0), ('municipio', 0), ('asunto', 0);
\ No newline at end of file
@@ -0,0 +1,152 @@
+import os
+import json
+import time
+import hashlib
+import threading
+
+from sqlalchemy import event, select, update, insert
+
+from model.models import CatalogoVersion, normalizar_nombre
+
+
+class CatalogCache:
+    """
+    Caché en memoria de los catálogos (nivel, municipio, asunto).
+
+    Cada catálogo tiene un número de versión en la tabla `catalogo_version`
+    que se incrementa en la misma transacción que modifica el catálogo. Cada
+    proceso compara sus versiones con las de la BD como máximo una vez cada
+    `check_interval` segundos (una consulta por PK) y recarga solo los
+    catálogos que cambiaron, así todos los workers convergen sin consultar los
+    catálogos en cada petición. En el proceso que hizo el cambio la caché se
+    invalida al confirmar la transacción.
+
+    Las búsquedas por nombre ignoran mayúsculas y acentos, igual que la
+    collation de MySQL ('torreon' encuentra 'Torreón').
+    """
+
+    def __init__(self, session_factory, catalog_map, check_interval=None):
+        self.session_factory = session_factory
+        self.catalog_map = catalog_map
+        if check_interval is None:
+            check_interval = float(os.getenv('CATALOG_CACHE_CHECK_SECONDS', '1'))
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        self._state = {}
+        self._checked_at = 0.0
+        event.listen(session_factory, 'after_commit', self._after_commit)
+
+    # ----- lectura -----
+
+    def items(self, cat):
+        """Lista de {'id', 'name'} ordenada por nombre."""
+        return self._get(cat)['items']
+
+    def version(self, cat):
+        return self._get(cat)['version']
+
+    def etag(self, *cats):
+        """ETag estable derivado del contenido de los catálogos indicados
+        (todos si no se indica ninguno); igual en todos los procesos."""
+        cats = cats or tuple(self.catalog_map)
+        if len(cats) == 1:
+            return self._get(cats[0])['etag']
+        combinado = '|'.join(f'{cat}:{self._get(cat)["etag"]}' for cat in cats)
+        return hashlib.sha1(combinado.encode()).hexdigest()[:20]
+
+    def id_por_nombre(self, cat, nombre):
+        if not nombre:
+            return None
+        return self._get(cat)['by_name'].get(normalizar_nombre(nombre))
+
+    def nombre_por_id(self, cat, obj_id):
+        if obj_id is None:
+            return None
+        return self._get(cat)['by_id'].get(obj_id)
+
+    # ----- escritura -----
+
+    def bump(self, db, cat):
+        """Incrementa la versión del catálogo dentro de la transacción de `db`.
+        Llamar en toda escritura de catálogos."""
+        res = db.execute(
+            update(CatalogoVersion)
+            .where(CatalogoVersion.catalogo == cat)
+            .values(version=CatalogoVersion.version + 1)
+        )
+        if not res.rowcount:
+            self._insertar_version(db, cat)
+        db.info['catalogos_modificados'] = True
+
+    @staticmethod
+    def _insertar_version(db, cat):
+        # Primera versión del catálogo (BD creada sin los datos iniciales de
+        # schema.sql); con upsert para no chocar con otra transacción que la
+        # cree al mismo tiempo
+        dialecto = db.get_bind().dialect.name
+        if dialecto == 'mysql':
+            from sqlalchemy.dialects.mysql import insert as mysql_insert
+            stmt = mysql_insert(CatalogoVersion).values(catalogo=cat, version=1)
+            stmt = stmt.on_duplicate_key_update(version=CatalogoVersion.version + 1)
+        elif dialecto == 'sqlite':
+            from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+            stmt = sqlite_insert(CatalogoVersion).values(catalogo=cat, version=1)
+            stmt = stmt.on_conflict_do_update(index_elements=['catalogo'],
+                                              set_={'version': CatalogoVersion.version + 1})
+        else:
+            stmt = insert(CatalogoVersion).values(catalogo=cat, version=1)
+        db.execute(stmt)
+
+    def invalidate(self):
+        """Fuerza a comparar versiones con la BD en la siguiente lectura."""
+        self._checked_at = 0.0
+
+    def _after_commit(self, session):
+        if session.info.pop('catalogos_modificados', False):
+            self.invalidate()
+
+    # ----- interno -----
+
+    def _get(self, cat):
+        if cat not in self.catalog_map:
+            raise KeyError(cat)
+        if time.monotonic() - self._checked_at >= self.check_interval or cat not in self._state:
+            self._refresh()
+        return self._state[cat]
+
+    def _refresh(self):
+        with self._lock:
+            # otro hilo pudo refrescar mientras esperábamos el candado
+            if time.monotonic() - self._checked_at < self.check_interval and \
+                    all(cat in self._state for cat in self.catalog_map):
+                return
+            db = self.session_factory()
+            try:
+                versiones = dict(db.execute(select(CatalogoVersion.catalogo, CatalogoVersion.version)).all())
+                state = dict(self._state)
+                for cat, cfg in self.catalog_map.items():
+                    version = versiones.get(cat, 0)
+                    if cat in state and state[cat]['version'] == version:
+                        continue
+                    state[cat] = self._load(db, cfg, version)
+                self._state = state
+                self._checked_at = time.monotonic()
+            finally:
+                db.close()
+
+    @staticmethod
+    def _load(db, cfg, version):
+        Model = cfg['model']
+        pk = getattr(Model, cfg['pk'])
+        name = getattr(Model, cfg['name_field'])
+        rows = db.execute(select(pk, name)).all()
+        rows.sort(key=lambda r: normalizar_nombre(r[1]))
+        items = [{'id': r[0], 'name': r[1]} for r in rows]
+        contenido = json.dumps(items, ensure_ascii=False, separators=(',', ':'))
+        return {
+            'version': version,
+            'etag': hashlib.sha1(contenido.encode('utf-8')).hexdigest()[:20],
+            'items': items,
+            'by_name': {normalizar_nombre(r[1]): r[0] for r in rows},
+            'by_id': {r[0]: r[1] for r in rows},
+        }
@@ -0,0 +1,107 @@
+import os
+import json
+import itertools
+import threading
+from collections import deque
+
+from sqlalchemy import event
+
+
+class Subscription:
+    """Cola acotada de un suscriptor. Si el cliente no consume a tiempo se
+    descartan los eventos más antiguos y se cuenta cuántos se perdieron."""
+
+    def __init__(self, buffer_size):
+        self._eventos = deque(maxlen=buffer_size)
+        self._cond = threading.Condition()
+        self.perdidos = 0
+
+    def _put(self, evento):
+        with self._cond:
+            if len(self._eventos) == self._eventos.maxlen:
+                self.perdidos += 1
+            self._eventos.append(evento)
+            self._cond.notify()
+
+    def get(self, timeout=None):
+        """Espera hasta `timeout` segundos y devuelve (eventos, perdidos)
+        acumulados desde la última llamada; ([], 0) si no llegó nada."""
+        with self._cond:
+            if not self._eventos:
+                self._cond.wait(timeout)
+            eventos = list(self._eventos)
+            self._eventos.clear()
+            perdidos, self.perdidos = self.perdidos, 0
+            return eventos, perdidos
+
+
+class EventBus:
+    """
+    Pub/sub en memoria del proceso para avisar a los paneles de administración
+    (altas, cambios de estatus y bajas de turnos) sin que cada uno consulte la BD.
+
+    Los eventos se publican solo si la transacción que los produjo se confirma:
+    `publicar_al_confirmar(db, ...)` los guarda en la sesión y se envían en su
+    after_commit (se descartan en un rollback). Cada proceso tiene su propio
+    bus; con varios workers un panel recibe los eventos del worker al que está
+    conectado.
+
+    SSE_BUFFER_SIZE (100) acota la cola de cada suscriptor y
+    SSE_MAX_SUBSCRIBERS (50) el número de conexiones abiertas por proceso.
+    """
+
+    def __init__(self, buffer_size=None, max_subscribers=None):
+        if buffer_size is None:
+            buffer_size = int(os.getenv('SSE_BUFFER_SIZE', '100'))
+        if max_subscribers is None:
+            max_subscribers = int(os.getenv('SSE_MAX_SUBSCRIBERS', '50'))
+        self.buffer_size = max(1, buffer_size)
+        self.max_subscribers = max_subscribers
+        self._lock = threading.Lock()
+        self._subs = set()
+        self._ids = itertools.count(1)
+
+    def subscribe(self):
+        """Nueva suscripción, o None si ya se alcanzó el máximo."""
+        with self._lock:
+            if len(self._subs) >= self.max_subscribers:
+                return None
+            sub = Subscription(self.buffer_size)
+            self._subs.add(sub)
+            return sub
+
+    def unsubscribe(self, sub):
+        with self._lock:
+            self._subs.discard(sub)
+
+    def publish(self, tipo, datos):
+        evento = {'id': next(self._ids), 'type': tipo, 'data': datos}
+        with self._lock:
+            subs = list(self._subs)
+        for sub in subs:
+            sub._put(evento)
+
+    # ----- integración con la sesión ORM -----
+
+    def publicar_al_confirmar(self, db, tipo, datos):
+        db.info.setdefault('eventos_pendientes', []).append((tipo, datos))
+
+    def registrar(self, session_factory):
+        event.listen(session_factory, 'after_commit', self._after_commit)
+        event.listen(session_factory, 'after_soft_rollback', self._after_soft_rollback)
+
+    def _after_commit(self, session):
+        for tipo, datos in session.info.pop('eventos_pendientes', []):
+            self.publish(tipo, datos)
+
+    @staticmethod
+    def _after_soft_rollback(session, previous_transaction):
+        # Solo al deshacer la transacción externa (no un savepoint)
+        if previous_transaction.parent is None:
+            session.info.pop('eventos_pendientes', None)
+
+    # ----- formato SSE -----
+
+    @staticmethod
+    def formato_sse(evento):
+        return f"id: {evento['id']}\nevent: {evento['type']}\ndata: {json.dumps(evento['data'], ensure_ascii=False)}\n\n"
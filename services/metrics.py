@@ -0,0 +1,218 @@
+import os
+import hmac
+import threading
+import bisect
+
+from flask import request, session, Response, abort
+
+# Límites (segundos) de los histogramas de latencia
+BUCKETS_SEGUNDOS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# Límites del histograma de sentencias SQL por petición
+BUCKETS_SQL = (1, 2, 5, 10, 20, 50, 100, 250, 1000)
+
+
+def _escapar(valor):
+    return str(valor).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _etiquetas(nombres, valores, extra=None):
+    pares = list(zip(nombres, valores))
+    if extra:
+        pares.append(extra)
+    if not pares:
+        return ''
+    return '{' + ','.join(f'{n}="{_escapar(v)}"' for n, v in pares) + '}'
+
+
+def _numero(v):
+    if v == float('inf'):
+        return '+Inf'
+    return repr(float(v)) if isinstance(v, float) else str(v)
+
+
+class _Metrica:
+    tipo = None
+
+    def __init__(self, nombre, ayuda, etiquetas=()):
+        self.nombre = nombre
+        self.ayuda = ayuda
+        self.etiquetas = tuple(etiquetas)
+        self._lock = threading.Lock()
+        self._series = {}
+
+    def _clave(self, etiquetas):
+        if set(etiquetas) != set(self.etiquetas):
+            raise ValueError(f'{self.nombre}: se esperaban las etiquetas {self.etiquetas}')
+        return tuple(str(etiquetas[n]) for n in self.etiquetas)
+
+    def _cabecera(self):
+        return [f'# HELP {self.nombre} {self.ayuda}', f'# TYPE {self.nombre} {self.tipo}']
+
+
+class Counter(_Metrica):
+    tipo = 'counter'
+
+    def inc(self, valor=1, **etiquetas):
+        clave = self._clave(etiquetas)
+        with self._lock:
+            self._series[clave] = self._series.get(clave, 0) + valor
+
+    def lineas(self):
+        with self._lock:
+            series = sorted(self._series.items())
+        return self._cabecera() + [
+            f'{self.nombre}{_etiquetas(self.etiquetas, clave)} {_numero(v)}' for clave, v in series
+        ]
+
+
+class Histogram(_Metrica):
+    tipo = 'histogram'
+
+    def __init__(self, nombre, ayuda, etiquetas=(), buckets=BUCKETS_SEGUNDOS):
+        super().__init__(nombre, ayuda, etiquetas)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, valor, **etiquetas):
+        clave = self._clave(etiquetas)
+        i = bisect.bisect_left(self.buckets, valor)
+        with self._lock:
+            serie = self._series.get(clave)
+            if serie is None:
+                # [conteos por bucket (no acumulados) + desbordes, suma, total]
+                serie = self._series[clave] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            serie[0][i] += 1
+            serie[1] += valor
+            serie[2] += 1
+
+    def lineas(self):
+        with self._lock:
+            series = sorted((clave, [list(s[0]), s[1], s[2]]) for clave, s in self._series.items())
+        lineas = self._cabecera()
+        for clave, (conteos, suma, total) in series:
+            acumulado = 0
+            for limite, n in zip(self.buckets + (float('inf'),), conteos):
+                acumulado += n
+                lineas.append(f'{self.nombre}_bucket{_etiquetas(self.etiquetas, clave, ("le", _numero(limite)))} {acumulado}')
+            lineas.append(f'{self.nombre}_sum{_etiquetas(self.etiquetas, clave)} {_numero(suma)}')
+            lineas.append(f'{self.nombre}_count{_etiquetas(self.etiquetas, clave)} {total}')
+        return lineas
+
+
+class Callback(_Metrica):
+    """Valor que se lee al exponer las métricas (p. ej. el estado del pool).
+    `funcion` devuelve un número, o None para omitir la métrica."""
+
+    def __init__(self, nombre, ayuda, funcion, tipo='gauge'):
+        super().__init__(nombre, ayuda)
+        self.funcion = funcion
+        self.tipo = tipo
+
+    def lineas(self):
+        valor = self.funcion()
+        if valor is None:
+            return []
+        return self._cabecera() + [f'{self.nombre} {_numero(valor)}']
+
+
+class Registry:
+    """
+    Registro de métricas en memoria del proceso, seguro entre hilos, que se
+    expone en el formato de texto de Prometheus (0.0.4).
+
+    Cada proceso tiene su propio registro: con varios workers de gunicorn cada
+    scrape ve el worker que atendió la petición (agregar por instancia/pid en
+    Prometheus).
+    """
+
+    CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._metricas = {}
+
+    def _agregar(self, metrica):
+        with self._lock:
+            if metrica.nombre in self._metricas:
+                raise ValueError(f'Métrica duplicada: {metrica.nombre}')
+            self._metricas[metrica.nombre] = metrica
+        return metrica
+
+    def counter(self, nombre, ayuda, etiquetas=()):
+        return self._agregar(Counter(nombre, ayuda, etiquetas))
+
+    def histogram(self, nombre, ayuda, etiquetas=(), buckets=BUCKETS_SEGUNDOS):
+        return self._agregar(Histogram(nombre, ayuda, etiquetas, buckets))
+
+    def callback(self, nombre, ayuda, funcion, tipo='gauge'):
+        return self._agregar(Callback(nombre, ayuda, funcion, tipo))
+
+    def exposicion(self):
+        with self._lock:
+            metricas = list(self._metricas.values())
+        lineas = []
+        for metrica in metricas:
+            try:
+                lineas.extend(metrica.lineas())
+            except Exception as e:
+                print(f'Error en métrica {metrica.nombre}:', e)
+        return '\n'.join(lineas) + '\n'
+
+
+class RequestMetrics:
+    """
+    Métricas por ruta de Flask: latencia, sentencias SQL y tiempo en BD de
+    cada petición (los dos últimos salen de `tiempos()`, p. ej.
+    RequestSession.tiempos). La etiqueta `route` es la regla de la ruta
+    (/api/turno/<int:turno_id>), no la URL, para acotar la cardinalidad.
+
+    Sirve /metrics solo con `Authorization: Bearer <METRICS_TOKEN>` o con
+    una sesión de administrador; sin METRICS_TOKEN, únicamente al admin.
+    METRICS_PUBLIC=1 la deja abierta (p. ej. si solo la alcanza la red interna
+    del scraper): las etiquetas exponen las rutas y el volumen de tráfico.
+    """
+
+    def __init__(self, registry, tiempos, token=None, publico=None):
+        self.registry = registry
+        self.tiempos = tiempos
+        self.token = token if token is not None else os.getenv('METRICS_TOKEN', '')
+        if publico is None:
+            publico = os.getenv('METRICS_PUBLIC', '').strip().lower() in ('1', 'true', 'yes', 'si', 'sí', 'on')
+        self.publico = publico
+        etiquetas = ('method', 'route')
+        self.peticiones = registry.counter(
+            'http_requests_total', 'Peticiones HTTP atendidas.', etiquetas + ('status',))
+        self.latencia = registry.histogram(
+            'http_request_duration_seconds', 'Duración de la petición (incluye el COMMIT).', etiquetas)
+        self.sql = registry.histogram(
+            'http_request_sql_statements', 'Sentencias SQL ejecutadas por petición.', etiquetas, BUCKETS_SQL)
+        self.db = registry.histogram(
+            'http_request_db_seconds', 'Tiempo en la base de datos por petición.', etiquetas)
+
+    def registrar(self, app, ruta='/metrics'):
+        """Las funciones after_request corren en orden inverso al registro:
+        registrar antes que la sesión por petición para medir también su COMMIT."""
+        app.after_request(self._observar)
+        app.add_url_rule(ruta, 'metrics', self._exponer)
+
+    def _observar(self, response):
+        try:
+            t = self.tiempos()
+            regla = request.url_rule.rule if request.url_rule is not None else 'sin_ruta'
+            self.peticiones.inc(method=request.method, route=regla, status=response.status_code)
+            self.latencia.observe(t['total'], method=request.method, route=regla)
+            self.sql.observe(t['consultas'], method=request.method, route=regla)
+            self.db.observe(t['db'], method=request.method, route=regla)
+        except Exception as e:
+            print('Error al registrar métricas:', e)
+        return response
+
+    def _autorizado(self):
+        if self.publico or session.get('role') == 'admin':
+            return True
+        cabecera = request.headers.get('Authorization', '')
+        return bool(self.token) and hmac.compare_digest(cabecera.encode(), f'Bearer {self.token}'.encode())
+
+    def _exponer(self):
+        if not self._autorizado():
+            abort(401)
+        return Response(self.registry.exposicion(), content_type=Registry.CONTENT_TYPE)
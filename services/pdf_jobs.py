@@ -0,0 +1,155 @@
+import os
+import time
+import threading
+import logging
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+
+from services.pdf_service import PDFGenerator
+
+_worker_generator = None
+
+
+def _render(turno_data, output_path):
+    """Se ejecuta en el proceso trabajador: genera el PDF en un archivo temporal
+    y lo publica con un rename atómico, así nunca se sirve un PDF a medias.
+    Devuelve los segundos que tomó el render (el proceso padre los registra)."""
+    return _generar('generate_ticket_pdf', turno_data, output_path)
+
+
+def _render_lote(turnos, output_path):
+    """Como _render, pero un solo PDF con un comprobante por página (exportación)."""
+    return _generar('generate_batch_pdf', turnos, output_path)
+
+
+def _generar(metodo, datos, output_path):
+    global _worker_generator
+    if _worker_generator is None:
+        _worker_generator = PDFGenerator()
+    tmp_path = f'{output_path}.{os.getpid()}.tmp'
+    inicio = time.perf_counter()
+    try:
+        getattr(_worker_generator, metodo)(datos, tmp_path)
+        os.replace(tmp_path, output_path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    return time.perf_counter() - inicio
+
+
+class PDFJobQueue:
+    """
+    Cola de generación de PDFs fuera del ciclo de la petición.
+
+    Los trabajos se ejecutan en un pool de procesos (ReportLab y qrcode son CPU
+    puro y no liberan el GIL). El id de un trabajo es el nombre del archivo sin
+    extensión, de modo que cualquier worker de la aplicación puede responder el
+    estado revisando si el archivo ya existe, aunque no haya encolado el trabajo.
+
+    Con `workers=0` los PDFs se generan en línea (útil en desarrollo).
+
+    Los futures se descartan al terminar; de los trabajos fallidos solo se
+    guardan los últimos MAX_ERRORES ids para que `status()` responda 'error'.
+    """
+
+    MAX_ERRORES = 1000
+
+    def __init__(self, pdf_dir, workers=None):
+        self.pdf_dir = pdf_dir
+        if workers is None:
+            workers = int(os.getenv('PDF_WORKERS', '2'))
+        self.workers = max(0, workers)
+        self._executor = None
+        self._lock = threading.Lock()
+        self._futures = {}
+        self._errores = OrderedDict()
+        # Función opcional observador(tipo, segundos) con la duración de cada render
+        self.observador = None
+
+    def _get_executor(self):
+        # Se crea de forma perezosa para que exista después del fork de gunicorn
+        with self._lock:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(max_workers=self.workers)
+            return self._executor
+
+    def path_for(self, job_id):
+        return os.path.join(self.pdf_dir, f'{job_id}.pdf')
+
+    def submit(self, job_id, turno_data):
+        """Encola la generación del PDF `job_id` y devuelve el id del trabajo."""
+        os.makedirs(self.pdf_dir, exist_ok=True)
+        return self._encolar(job_id, turno_data, self.path_for(job_id), _render)
+
+    def submit_lote(self, job_id, turnos, output_path):
+        """Encola un PDF con un comprobante por página (lista de dicts como
+        los de submit) en `output_path`; su estado se consulta con
+        status(job_id, output_path)."""
+        return self._encolar(job_id, turnos, output_path, _render_lote)
+
+    def _encolar(self, job_id, datos, output_path, render):
+        if self.workers == 0:
+            self._observar(render(datos, output_path))
+            return job_id
+
+        future = self._get_executor().submit(render, datos, output_path)
+        with self._lock:
+            self._futures[job_id] = future
+            self._errores.pop(job_id, None)
+        future.add_done_callback(lambda f: self._on_done(job_id, f))
+        return job_id
+
+    def _on_done(self, job_id, future):
+        exc = future.exception()
+        # Los trabajos terminados se resuelven por existencia del archivo o,
+        # si fallaron, por el registro acotado de errores
+        with self._lock:
+            if self._futures.get(job_id) is future:
+                del self._futures[job_id]
+                if exc is not None:
+                    self._errores[job_id] = True
+                    self._errores.move_to_end(job_id)
+                    while len(self._errores) > self.MAX_ERRORES:
+                        self._errores.popitem(last=False)
+        if exc is not None:
+            logging.error(f"❌ Error al generar PDF {job_id}: {exc}")
+            return
+        self._observar(future.result())
+
+    def _observar(self, segundos):
+        if self.observador is not None:
+            try:
+                self.observador('job', segundos)
+            except Exception as e:
+                logging.error(f"❌ Error al registrar la duración del PDF: {e}")
+
+    def status(self, job_id, output_path=None):
+        """Devuelve 'pending', 'ready', 'error' o 'unknown'."""
+        with self._lock:
+            future = self._futures.get(job_id)
+            fallido = job_id in self._errores
+        if future is not None:
+            if not future.done():
+                return 'pending'
+            if future.exception() is not None:
+                return 'error'
+        elif fallido:
+            return 'error'
+        if os.path.exists(output_path or self.path_for(job_id)):
+            return 'ready'
+        return 'unknown'
+
+    def wait(self, job_id, timeout=None):
+        """Bloquea hasta que el trabajo termine (si lo encoló este proceso)."""
+        with self._lock:
+            future = self._futures.get(job_id)
+        if future is not None:
+            future.result(timeout=timeout)
+        return self.status(job_id)
+
+    def shutdown(self):
+        # Se espera fuera del candado: _on_done lo necesita para terminar
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=True)
@@ -1,15 +1,41 @@
 from reportlab.lib import colors
 from reportlab.lib.pagesizes import letter
-from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table, TableStyle, Image
+from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table, TableStyle, Frame
+from reportlab.pdfgen import canvas as pdf_canvas
 from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
 from reportlab.lib.units import inch
 import os
+import re
+import time
+import hashlib
+import threading
 from datetime import datetime
 import io
-import qrcode
+
+from services.qr_service import QRFlowable
+
+MARGIN = 72
+
+# Etiquetas de la tabla del comprobante (parte fija de la plantilla)
+TICKET_LABELS = (
+    "Número de Turno:",
+    "Municipio:",
+    "Nivel:",
+    "Asunto:",
+    "CURP:",
+    "Solicitante (quien realiza el trámite):",
+    "Trámite para (persona beneficiaria):",
+    "Fecha:",
+)
+
 
 class PDFGenerator:
-    def __init__(self):
+    def __init__(self, compiled=True):
+        # compiled=True: las partes fijas del comprobante se construyen una vez
+        self.compiled = compiled
+        self._local = threading.local()
+        # Función opcional observador(tipo, segundos) para medir el render
+        self.observador = None
         self.styles = getSampleStyleSheet()
         self.title_style = ParagraphStyle(
             'CustomTitle',
@@ -37,23 +63,99 @@ class PDFGenerator:
         )
 
     def generate_ticket_pdf(self, turno_data, output_path):
-        """Genera un PDF con los datos del turno"""
+        """Genera un PDF con los datos del turno.
+        `output_path` puede ser una ruta o un objeto tipo archivo (p. ej. BytesIO)."""
         doc = SimpleDocTemplate(
             output_path,
             pagesize=letter,
-            rightMargin=72,
-            leftMargin=72,
-            topMargin=72,
-            bottomMargin=72
+            rightMargin=MARGIN,
+            leftMargin=MARGIN,
+            topMargin=MARGIN,
+            bottomMargin=MARGIN
         )
 
-        # Lista de elementos a agregar al PDF
-        elements = []
+        # Generar el PDF
+        inicio = time.perf_counter()
+        doc.build(self._ticket_elements(turno_data))
+        self._observar('ticket', inicio)
+        return output_path
+
+    def _observar(self, tipo, inicio):
+        if self.observador is not None:
+            self.observador(tipo, time.perf_counter() - inicio)
+
+    def render_ticket_pdf(self, turno_data):
+        """Genera el PDF en memoria y devuelve su contenido en bytes."""
+        buf = io.BytesIO()
+        self.generate_ticket_pdf(turno_data, buf)
+        return buf.getvalue()
+
+    def generate_batch_pdf(self, turnos, output):
+        """Genera un solo PDF con un comprobante por página.
 
-        # Título
-        title = Paragraph("Comprobante de Turno", self.title_style)
-        elements.append(title)
-        elements.append(Spacer(1, 12))
+        `turnos` puede ser cualquier iterable (p. ej. un generador sobre la
+        consulta): cada comprobante se dibuja y se cierra su página antes de
+        pedir el siguiente, así nunca se tienen todos los flowables en memoria.
+        Devuelve el número de comprobantes escritos."""
+        inicio = time.perf_counter()
+        width, height = letter
+        c = pdf_canvas.Canvas(output, pagesize=letter)
+        total = 0
+        for turno_data in turnos:
+            elements = self._ticket_elements(turno_data)
+            while elements:
+                frame = Frame(MARGIN, MARGIN, width - 2 * MARGIN, height - 2 * MARGIN)
+                pendientes = len(elements)
+                frame.addFromList(elements, c)
+                if len(elements) == pendientes:
+                    # No cabe ni en una página vacía: se omite para no ciclar
+                    elements.pop(0)
+                c.showPage()
+            total += 1
+        if total == 0:
+            c.drawString(MARGIN, height - MARGIN, "No hay turnos para los filtros seleccionados.")
+            c.showPage()
+        c.save()
+        self._observar('lote', inicio)
+        return total
+
+    def _compile_template(self):
+        """Construye las partes fijas del comprobante: título, etiquetas, estilo
+        de tabla, leyenda del QR y nota al pie. Solo cambian los valores."""
+        return {
+            'title': Paragraph("Comprobante de Turno", self.title_style),
+            'labels': [Paragraph(label, self.label_style) for label in TICKET_LABELS],
+            'table_style': TableStyle([
+                ('VALIGN', (0, 0), (-1, -1), 'TOP'),
+                ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
+                ('LEFTPADDING', (0, 0), (-1, -1), 6),
+                ('RIGHTPADDING', (0, 0), (-1, -1), 6),
+                ('TOPPADDING', (0, 0), (-1, -1), 6),
+                ('BOTTOMPADDING', (0, 0), (-1, -1), 6),
+                ('TEXTCOLOR', (0, 0), (-1, -1), colors.black),
+                ('GRID', (0, 0), (-1, -1), 0.5, colors.gray),
+            ]),
+            'qr_caption': Paragraph('Código QR (identifica CURP del solicitante):', self.styles['Normal']),
+            'footer': Paragraph("""Este documento es un comprobante de su turno. 
+        Por favor, consérvelo para futuras referencias.""", self.styles["Normal"]),
+        }
+
+    def _template(self):
+        """Plantilla precompilada. Es una por hilo porque los Paragraph guardan
+        su estado de maquetación (wrap) y no deben compartirse entre hilos."""
+        if not self.compiled:
+            return self._compile_template()
+        template = getattr(self._local, 'template', None)
+        if template is None:
+            template = self._local.template = self._compile_template()
+        return template
+
+    def _ticket_elements(self, turno_data):
+        """Flowables de un comprobante (título, tabla de datos, QR y nota)."""
+        template = self._template()
+
+        # Lista de elementos a agregar al PDF
+        elements = [template['title'], Spacer(1, 12)]
 
         # Preparar nombres: solicitante y persona a quien va dirigido el trámite
         solicitante = turno_data.get('nombre_completo', '')
@@ -72,38 +174,27 @@ class PDFGenerator:
             except Exception:
                 fecha_txt = str(turno_data['fecha_registro'])
 
-        # Datos del turno (etiquetas más claras)
-        data = [
-            ["Número de Turno:", str(turno_data.get('numero_turno', ''))],
-            ["Municipio:", turno_data.get('municipio', '')],
-            ["Nivel:", turno_data.get('nivel', '')],
-            ["Asunto:", turno_data.get('asunto', '')],
-            ["CURP:", turno_data.get('curp', '')],
-            ["Solicitante (quien realiza el trámite):", solicitante],
-            ["Trámite para (persona beneficiaria):", tramite_para],
-            ["Fecha:", fecha_txt]
+        # Valores del turno, en el mismo orden que TICKET_LABELS
+        values = [
+            str(turno_data.get('numero_turno', '')),
+            turno_data.get('municipio', ''),
+            turno_data.get('nivel', ''),
+            turno_data.get('asunto', ''),
+            turno_data.get('curp', ''),
+            solicitante,
+            tramite_para,
+            fecha_txt
         ]
 
-        # Convertir textos a Paragraphs para que se ajusten y no se empalmen
+        # Convertir valores a Paragraphs para que se ajusten y no se empalmen
         data_par = []
-        for label, val in data:
-            lab = Paragraph(str(label), self.label_style)
+        for lab, val in zip(template['labels'], values):
             val_text = '' if val is None else str(val)
-            valp = Paragraph(val_text, self.value_style)
-            data_par.append([lab, valp])
+            data_par.append([lab, Paragraph(val_text, self.value_style)])
 
         # Crear tabla con los datos (dos columnas, la segunda permite wrapping)
         table = Table(data_par, colWidths=[2*inch, 4.5*inch], hAlign='LEFT')
-        table.setStyle(TableStyle([
-            ('VALIGN', (0, 0), (-1, -1), 'TOP'),
-            ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
-            ('LEFTPADDING', (0, 0), (-1, -1), 6),
-            ('RIGHTPADDING', (0, 0), (-1, -1), 6),
-            ('TOPPADDING', (0, 0), (-1, -1), 6),
-            ('BOTTOMPADDING', (0, 0), (-1, -1), 6),
-            ('TEXTCOLOR', (0, 0), (-1, -1), colors.black),
-            ('GRID', (0, 0), (-1, -1), 0.5, colors.gray),
-        ]))
+        table.setStyle(template['table_style'])
 
         elements.append(table)
         elements.append(Spacer(1, 30))
@@ -115,15 +206,9 @@ class PDFGenerator:
         if curp or numero_turno or nombre_completo:
             try:
                 qr_text = f"CURP: {curp}\nTurno: {numero_turno}\nNombre: {nombre_completo}"
-                qr_img = qrcode.make(qr_text)
-                buf = io.BytesIO()
-                qr_img.save(buf, format='PNG')
-                buf.seek(0)
-                # Insertar imagen del QR (tamaño aproximado 1.5 inch)
-                qr_width = 1.5 * inch
-                qr = Image(buf, width=qr_width, height=qr_width)
-                qr.hAlign = 'CENTER'
-                elements.append(Paragraph('Código QR (identifica CURP del solicitante):', self.styles['Normal']))
+                # QR vectorial (tamaño aproximado 1.5 inch); la matriz se cachea por contenido
+                qr = QRFlowable(qr_text, 1.5 * inch)
+                elements.append(template['qr_caption'])
                 elements.append(Spacer(1, 6))
                 elements.append(qr)
                 elements.append(Spacer(1, 12))
@@ -132,11 +217,173 @@ class PDFGenerator:
                 pass
 
         # Nota al pie
-        footer_text = """Este documento es un comprobante de su turno. 
-        Por favor, consérvelo para futuras referencias."""
-        footer = Paragraph(footer_text, self.styles["Normal"])
-        elements.append(footer)
+        elements.append(template['footer'])
+        return elements
 
-        # Generar el PDF
-        doc.build(elements)
-        return output_path
\ No newline at end of file
+
+class PDFCache:
+    """
+    Caché de PDFs direccionada por contenido.
+
+    El nombre de cada archivo incluye un hash de los campos que aparecen en el
+    comprobante (`turno_<id>_<hash>.pdf`), así que si los datos no cambiaron se
+    reutiliza el archivo existente en lugar de volver a generarlo.
+
+    La limpieza solo borra versiones reemplazadas (cuando el turno se editó y
+    ya tiene un PDF más reciente): por antigüedad y, si el directorio excede
+    el tamaño máximo, de la más vieja a la más nueva. El PDF vigente de cada
+    turno nunca se borra, porque su URL ya se entregó al ciudadano y nada lo
+    volvería a generar; los de un turno se borran al eliminarlo
+    (`eliminar_turnos`).
+    """
+
+    CAMPOS = ('numero_turno', 'curp', 'nombre_completo', 'nombre', 'paterno', 'materno',
+              'municipio', 'nivel', 'asunto', 'fecha_registro')
+    _NOMBRE_RE = re.compile(r'^turno_(\d+)(?:_\w+)?\.pdf$')
+
+    def __init__(self, directory, max_bytes=None, max_age=None, evict_interval=60):
+        self.directory = directory
+        if max_bytes is None:
+            max_bytes = int(os.getenv('PDF_CACHE_MAX_MB', '500')) * 1024 * 1024
+        if max_age is None:
+            max_age = int(os.getenv('PDF_CACHE_MAX_DAYS', '30')) * 86400
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.evict_interval = evict_interval
+        self._last_evict = 0.0
+        self._evicting = False
+        self._excedido = False
+        self._lock = threading.Lock()
+
+    @classmethod
+    def digest(cls, turno_data):
+        """Hash estable de los campos normalizados del comprobante."""
+        partes = []
+        for campo in cls.CAMPOS:
+            valor = turno_data.get(campo)
+            if isinstance(valor, datetime):
+                valor = valor.strftime("%d/%m/%Y %H:%M:%S")
+            valor = '' if valor is None else ' '.join(str(valor).split())
+            if campo == 'curp':
+                valor = valor.upper()
+            partes.append(valor)
+        return hashlib.sha256('\x1f'.join(partes).encode('utf-8')).hexdigest()[:16]
+
+    def key(self, turno_id, turno_data):
+        """Id de trabajo / nombre base del archivo para estos datos."""
+        return f'turno_{turno_id}_{self.digest(turno_data)}'
+
+    def path(self, key):
+        return os.path.join(self.directory, f'{key}.pdf')
+
+    def get(self, key):
+        """Devuelve la ruta si el PDF ya existe (y renueva su antigüedad)."""
+        path = self.path(key)
+        try:
+            os.utime(path)
+        except OSError:
+            return None
+        return path
+
+    def eliminar_turnos(self, turno_ids):
+        """Borra todas las versiones de los PDFs de esos turnos (eliminados).
+        Devuelve el número de archivos eliminados."""
+        turno_ids = set(turno_ids)
+        try:
+            nombres = os.listdir(self.directory)
+        except OSError:
+            return 0
+        eliminados = 0
+        for nombre in nombres:
+            m = self._NOMBRE_RE.match(nombre)
+            if m and int(m.group(1)) in turno_ids:
+                eliminados += self._remove(os.path.join(self.directory, nombre))
+        return eliminados
+
+    def maybe_evict(self):
+        """Lanza `evict` en un hilo aparte como máximo una vez cada
+        `evict_interval` segundos; no bloquea la petición que la llama.
+        Devuelve True si lanzó una limpieza."""
+        now = time.time()
+        with self._lock:
+            if self._evicting or now - self._last_evict < self.evict_interval:
+                return False
+            self._last_evict = now
+            self._evicting = True
+        threading.Thread(target=self._evict_en_segundo_plano, daemon=True).start()
+        return True
+
+    def _evict_en_segundo_plano(self):
+        try:
+            self.evict()
+        except Exception as e:
+            print('Error al limpiar la caché de PDFs:', e)
+        finally:
+            with self._lock:
+                self._evicting = False
+
+    def evict(self):
+        """Elimina las versiones reemplazadas vencidas y, si se excede el tamaño
+        máximo, las demás versiones reemplazadas de la más antigua a la más
+        nueva. El PDF vigente de cada turno no se elimina.
+        Devuelve el número de archivos eliminados."""
+        try:
+            nombres = os.listdir(self.directory)
+        except OSError:
+            return 0
+
+        now = time.time()
+        archivos = []
+        for nombre in nombres:
+            m = self._NOMBRE_RE.match(nombre)
+            if not m:
+                continue
+            path = os.path.join(self.directory, nombre)
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            archivos.append((st.st_mtime, st.st_size, int(m.group(1)), path))
+
+        # La versión más reciente de cada turno es la vigente
+        vigentes = {}
+        for mtime, _, turno_id, path in archivos:
+            if turno_id not in vigentes or mtime > vigentes[turno_id][0]:
+                vigentes[turno_id] = (mtime, path)
+        vigentes = {path for _, path in vigentes.values()}
+
+        eliminados = 0
+        total = 0
+        candidatos = []
+        for mtime, size, _, path in archivos:
+            if path in vigentes:
+                total += size
+                continue
+            if now - mtime > self.max_age:
+                eliminados += self._remove(path)
+                continue
+            total += size
+            candidatos.append((mtime, size, path))
+
+        candidatos.sort()
+        for _, size, path in candidatos:
+            if total <= self.max_bytes:
+                break
+            if self._remove(path):
+                eliminados += 1
+                total -= size
+        # El aviso sale una vez al pasar el límite, no en cada limpieza
+        excedido = total > self.max_bytes
+        if excedido and not self._excedido:
+            print(f'Caché de PDFs: los comprobantes vigentes ocupan {total // (1024 * 1024)} MB, '
+                  f'más que PDF_CACHE_MAX_MB; considere PDF_MODE=stream')
+        self._excedido = excedido
+        return eliminados
+
+    @staticmethod
+    def _remove(path):
+        try:
+            os.remove(path)
+            return 1
+        except OSError:
+            return 0
@@ -0,0 +1,93 @@
+from sqlalchemy import select, insert, update, func
+from sqlalchemy.exc import IntegrityError
+
+from model.models import Persona, normalizar_nombre
+
+# Campos de Persona que se escriben desde los formularios
+CAMPOS = ('nombre_completo', 'nombre', 'paterno', 'materno', 'telefono', 'celular', 'correo')
+
+
+def _valores(curp, datos):
+    valores = {c: datos.get(c) for c in CAMPOS}
+    valores['curp'] = curp.upper()
+    # Core no pasa por los eventos del mapper: nombre_busqueda se calcula aquí
+    valores['nombre_busqueda'] = normalizar_nombre(valores['nombre_completo'])
+    return valores
+
+
+def obtener_o_crear(db, curp, datos):
+    """Alta de la persona si la CURP no existe; si ya existe NO se modifica
+    (el registro guardado manda: el kiosco es público y solo identifica por
+    CURP). Devuelve (id_persona, datos guardados con CAMPOS).
+
+    Atómico frente a registros simultáneos con la misma CURP:
+    - MySQL: INSERT ... ON DUPLICATE KEY UPDATE id_persona =
+      LAST_INSERT_ID(id_persona), que no cambia la fila existente; luego se
+      leen los datos guardados (MySQL no tiene RETURNING).
+    - SQLite: INSERT ... ON CONFLICT DO NOTHING RETURNING id_persona; solo
+      si hubo conflicto se lee la fila existente.
+    - Otros motores: INSERT en un savepoint y lectura si chocó con UNIQUE.
+    """
+    valores = _valores(curp, datos)
+    dialecto = db.get_bind().dialect.name
+
+    if dialecto == 'mysql':
+        from sqlalchemy.dialects.mysql import insert as mysql_insert
+        stmt = mysql_insert(Persona).values(**valores)
+        stmt = stmt.on_duplicate_key_update(id_persona=func.last_insert_id(Persona.id_persona))
+        db.execute(stmt)
+    elif dialecto == 'sqlite':
+        from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+        stmt = sqlite_insert(Persona).values(**valores).on_conflict_do_nothing(index_elements=['curp'])
+        id_persona = db.execute(stmt.returning(Persona.id_persona)).scalar()
+        if id_persona is not None:
+            return id_persona, {c: valores[c] for c in CAMPOS}
+    else:
+        try:
+            with db.begin_nested():
+                db.execute(insert(Persona).values(**valores))
+        except IntegrityError:
+            pass
+    # Lectura con candado: ve la fila aunque la haya confirmado otra
+    # transacción después de la instantánea de esta (REPEATABLE READ)
+    fila = db.execute(
+        select(Persona.id_persona, *(getattr(Persona, c) for c in CAMPOS))
+        .where(Persona.curp == valores['curp']).with_for_update()
+    ).one()
+    return fila.id_persona, {c: getattr(fila, c) for c in CAMPOS}
+
+
+def actualizar(db, curp, datos):
+    """Escribe `datos` (dict con CAMPOS) en la persona con esa CURP, o la
+    crea si no existe, en una sola sentencia atómica. Devuelve id_persona.
+    Solo para rutas que ya verificaron la identidad (CURP + número de turno).
+    - MySQL: INSERT ... ON DUPLICATE KEY UPDATE ...,
+      id_persona = LAST_INSERT_ID(id_persona); el id llega en lastrowid.
+    - SQLite: INSERT ... ON CONFLICT (curp) DO UPDATE ... RETURNING id_persona.
+    - Otros motores: UPDATE y, si no había fila, INSERT en un savepoint.
+    """
+    valores = _valores(curp, datos)
+    cambios = {c: valores[c] for c in valores if c != 'curp'}
+    dialecto = db.get_bind().dialect.name
+
+    if dialecto == 'mysql':
+        from sqlalchemy.dialects.mysql import insert as mysql_insert
+        stmt = mysql_insert(Persona).values(**valores)
+        stmt = stmt.on_duplicate_key_update(
+            id_persona=func.last_insert_id(Persona.id_persona), **cambios)
+        return db.execute(stmt).lastrowid
+
+    if dialecto == 'sqlite':
+        from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+        stmt = sqlite_insert(Persona).values(**valores)
+        stmt = stmt.on_conflict_do_update(index_elements=['curp'], set_=cambios)
+        return db.execute(stmt.returning(Persona.id_persona)).scalar_one()
+
+    res = db.execute(update(Persona).where(Persona.curp == valores['curp']).values(**cambios))
+    if not res.rowcount:
+        try:
+            with db.begin_nested():
+                db.execute(insert(Persona).values(**valores))
+        except IntegrityError:
+            db.execute(update(Persona).where(Persona.curp == valores['curp']).values(**cambios))
+    return db.execute(select(Persona.id_persona).where(Persona.curp == valores['curp'])).scalar_one()
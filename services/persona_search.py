@@ -0,0 +1,88 @@
+from sqlalchemy import select, update
+from sqlalchemy.dialects.mysql import match
+
+from model.models import Persona, normalizar_nombre
+
+# Con el parser ngram de MySQL (ngram_token_size=2 por defecto) los términos
+# de una sola letra no están en el índice; esos se filtran con LIKE.
+MIN_TERMINO_FULLTEXT = 2
+
+
+def terminos(texto):
+    """Términos normalizados de una búsqueda por nombre."""
+    return normalizar_nombre(texto).split()
+
+
+def _usa_fulltext(bind):
+    return bind is not None and bind.dialect.name == 'mysql'
+
+
+def _relevancia(largos):
+    """Expresión MATCH ... AGAINST en modo booleano: todos los términos son
+    obligatorios y cada uno se busca como frase (subcadena con ngram)."""
+    consulta = ' '.join(f'+"{t}"' for t in largos)
+    return match(Persona.nombre_busqueda, against=consulta).in_boolean_mode()
+
+
+def filtrar_por_nombre(query, texto):
+    """Filtra por nombre una consulta que incluye Persona.
+
+    En MySQL usa el índice FULLTEXT (ngram) sobre `nombre_busqueda`; en otros
+    motores (p. ej. SQLite en desarrollo) cae a LIKE sobre la misma columna
+    normalizada, así la búsqueda es igual de insensible a acentos y mayúsculas."""
+    lista = terminos(texto)
+    if not lista:
+        return query
+
+    if _usa_fulltext(query.session.bind):
+        largos = [t for t in lista if len(t) >= MIN_TERMINO_FULLTEXT]
+        cortos = [t for t in lista if len(t) < MIN_TERMINO_FULLTEXT]
+        if largos:
+            query = query.filter(_relevancia(largos) > 0)
+    else:
+        cortos = lista
+
+    for t in cortos:
+        query = query.filter(Persona.nombre_busqueda.contains(t, autoescape=True))
+    return query
+
+
+def buscar_personas(db, texto, limit=20):
+    """Personas que coinciden con `texto`, ordenadas por relevancia.
+    Devuelve una lista de (persona, score); score es None sin FULLTEXT."""
+    lista = terminos(texto)
+    if not lista:
+        return []
+
+    query = filtrar_por_nombre(db.query(Persona), texto)
+    largos = [t for t in lista if len(t) >= MIN_TERMINO_FULLTEXT]
+    if _usa_fulltext(db.bind) and largos:
+        score = _relevancia(largos).label('score')
+        rows = query.add_columns(score).order_by(score.desc(), Persona.nombre_completo).limit(limit).all()
+        return [(p, float(s)) for p, s in rows]
+    return [(p, None) for p in query.order_by(Persona.nombre_completo).limit(limit).all()]
+
+
+def reindexar(db, batch=1000):
+    """Recalcula `nombre_busqueda` para todas las personas (por lotes de id).
+    Necesario una vez al agregar la columna a una base existente.
+    Devuelve el número de personas actualizadas."""
+    total = 0
+    ultimo_id = 0
+    while True:
+        rows = db.execute(
+            select(Persona.id_persona, Persona.nombre_completo)
+            .where(Persona.id_persona > ultimo_id)
+            .order_by(Persona.id_persona)
+            .limit(batch)
+        ).all()
+        if not rows:
+            break
+        db.execute(update(Persona), [
+            {'id_persona': r.id_persona, 'nombre_busqueda': normalizar_nombre(r.nombre_completo)}
+            for r in rows
+        ])
+        db.commit()
+        total += len(rows)
+        ultimo_id = rows[-1].id_persona
+    return total
@@ -0,0 +1,65 @@
+import os
+import functools
+
+import qrcode
+from reportlab.lib import colors
+from reportlab.platypus import Flowable
+
+# QR_MASK_PATTERN (0-7) fija la máscara y evita probar las 8 posibles en cada
+# código; el QR sigue siendo válido aunque no sea el de menor penalización.
+_MASK = os.getenv('QR_MASK_PATTERN')
+MASK_PATTERN = int(_MASK) if _MASK not in (None, '') else None
+
+
+@functools.lru_cache(maxsize=int(os.getenv('QR_CACHE_SIZE', '1024')))
+def qr_runs(payload):
+    """Codifica `payload` y devuelve (n, filas), donde `n` es el número de módulos
+    por lado (incluye el margen) y cada fila es una tupla de tramos oscuros
+    (columna_inicial, longitud). Se cachea por contenido: regenerar el mismo
+    comprobante no vuelve a codificar el QR."""
+    qr = qrcode.QRCode(border=4, mask_pattern=MASK_PATTERN)
+    qr.add_data(payload)
+    qr.make(fit=True)
+    matrix = qr.get_matrix()
+
+    filas = []
+    for row in matrix:
+        tramos = []
+        inicio = None
+        for x, oscuro in enumerate(row):
+            if oscuro and inicio is None:
+                inicio = x
+            elif not oscuro and inicio is not None:
+                tramos.append((inicio, x - inicio))
+                inicio = None
+        if inicio is not None:
+            tramos.append((inicio, len(row) - inicio))
+        filas.append(tuple(tramos))
+    return len(matrix), tuple(filas)
+
+
+class QRFlowable(Flowable):
+    """Código QR dibujado como rectángulos vectoriales directamente en el canvas
+    (sin generar ni decodificar un PNG)."""
+
+    def __init__(self, payload, size):
+        super().__init__()
+        self.payload = payload
+        self.size = size
+        self.hAlign = 'CENTER'
+        # Codificar aquí para que un error se detecte al armar el comprobante
+        self.n, self.filas = qr_runs(payload)
+
+    def wrap(self, availWidth, availHeight):
+        return self.size, self.size
+
+    def draw(self):
+        modulo = self.size / self.n
+        path = self.canv.beginPath()
+        for y, tramos in enumerate(self.filas):
+            # La fila 0 de la matriz es la superior
+            py = self.size - (y + 1) * modulo
+            for x, largo in tramos:
+                path.rect(x * modulo, py, largo * modulo, modulo)
+        self.canv.setFillColor(colors.black)
+        self.canv.drawPath(path, stroke=0, fill=1)
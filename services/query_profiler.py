@@ -0,0 +1,182 @@
+import os
+import re
+import sys
+import json
+import time
+import threading
+from contextvars import ContextVar
+from datetime import datetime
+
+from flask import request, has_request_context
+from sqlalchemy import event
+
+# Conteo por plantilla de sentencia de la petición en curso:
+# {sql normalizado: [veces, segundos]}; None si el perfilador estaba apagado al empezar
+_conteos = ContextVar('query_profiler_conteos', default=None)
+
+_ESPACIOS = re.compile(r'\s+')
+# IN (?, ?, ?) / IN (%s, %s) con cualquier número de parámetros -> una sola plantilla
+_LISTA_PARAMS = re.compile(r'\((?:\s*(?:\?|%s|%\(\w+\)s|:\w+)\s*,)+\s*(?:\?|%s|%\(\w+\)s|:\w+)\s*\)')
+MAX_SQL = 2000
+
+
+def plantilla(statement):
+    """Texto de la sentencia sin espacios repetidos y con las listas de
+    parámetros colapsadas, para agrupar ejecuciones de la misma consulta."""
+    sql = _ESPACIOS.sub(' ', statement).strip()
+    return _LISTA_PARAMS.sub('(?...)', sql)[:MAX_SQL]
+
+
+def forma(parameters, executemany=False):
+    """Tipos de los parámetros enlazados, sin sus valores (no se registran
+    CURP, nombres ni correos)."""
+    if executemany:
+        filas = list(parameters or ())
+        return {'filas': len(filas), 'forma': forma(filas[0]) if filas else None}
+    if isinstance(parameters, dict):
+        return {k: type(v).__name__ for k, v in parameters.items()}
+    if isinstance(parameters, (list, tuple)):
+        return [type(v).__name__ for v in parameters]
+    return type(parameters).__name__
+
+
+class QueryProfiler:
+    """
+    Registro de consultas lentas y detector de N+1 sobre el engine.
+
+    - Consulta lenta: toda sentencia que tarda más de QUERY_SLOW_MS (200)
+      se escribe con su plantilla y la forma de sus parámetros.
+    - N+1: al terminar cada petición se reportan las plantillas que se
+      ejecutaron más de QUERY_NPLUSONE_MAX (10) veces.
+
+    La salida son líneas JSON (una por evento) en QUERY_LOG_PATH, o en
+    stderr si no está definido.
+
+    Está activo si QUERY_PROFILER=1 o si existe el archivo QUERY_PROFILER_FLAG
+    (por defecto query_profiler.flag en la carpeta instance/ de la aplicación,
+    que se crea con permisos 0700; no en el /tmp compartido, donde cualquier
+    usuario local podría encenderlo o plantar un symlink). El archivo se revisa cada
+    pocos segundos, así que se puede encender y apagar sin reiniciar en todos
+    los workers (también desde PUT /api/admin/query-profiler). Apagado, cada
+    sentencia solo paga una comparación.
+    """
+
+    INTERVALO_FLAG = 2.0
+
+    def __init__(self):
+        self.env_activo = os.getenv('QUERY_PROFILER', '').strip().lower() in ('1', 'true', 'yes', 'si', 'sí', 'on')
+        self.flag_path = os.getenv('QUERY_PROFILER_FLAG', '')
+        self.umbral = float(os.getenv('QUERY_SLOW_MS', '200')) / 1000
+        self.max_repeticiones = int(os.getenv('QUERY_NPLUSONE_MAX', '10'))
+        self.log_path = os.getenv('QUERY_LOG_PATH', '')
+        self._lock = threading.Lock()
+        self._archivo = None
+        self._flag_activo = False
+        self._flag_revisado = 0.0
+
+    def registrar(self, app, engine):
+        if not self.flag_path:
+            os.makedirs(app.instance_path, mode=0o700, exist_ok=True)
+            self.flag_path = os.path.join(app.instance_path, 'query_profiler.flag')
+        app.before_request(self._inicio_peticion)
+        app.after_request(self._fin_peticion)
+        event.listen(engine, 'before_cursor_execute', self._antes_sql)
+        event.listen(engine, 'after_cursor_execute', self._despues_sql)
+
+    # ----- encendido -----
+
+    def activo(self):
+        if self.env_activo:
+            return True
+        ahora = time.monotonic()
+        if ahora - self._flag_revisado >= self.INTERVALO_FLAG:
+            self._flag_revisado = ahora
+            self._flag_activo = self._flag_existe()
+        return self._flag_activo
+
+    def _flag_existe(self):
+        # Solo cuenta un archivo regular, no un symlink
+        return bool(self.flag_path) and os.path.isfile(self.flag_path) and not os.path.islink(self.flag_path)
+
+    def cambiar(self, activo):
+        """Crea o borra el archivo bandera (lo ven todos los procesos)."""
+        if activo:
+            # O_EXCL + O_NOFOLLOW: nunca se abre (ni trunca) lo que apunte un symlink
+            flags = os.O_WRONLY | os.O_CREAT | os.O_EXCL | getattr(os, 'O_NOFOLLOW', 0)
+            try:
+                os.close(os.open(self.flag_path, flags, 0o600))
+            except FileExistsError:
+                if not self._flag_existe():
+                    raise
+        elif os.path.lexists(self.flag_path):
+            os.remove(self.flag_path)
+        self._flag_activo = activo
+        self._flag_revisado = time.monotonic()
+
+    def estado(self):
+        return {
+            'activo': self.activo(),
+            'por_entorno': self.env_activo,
+            'flag_path': self.flag_path,
+            'slow_ms': self.umbral * 1000,
+            'nplusone_max': self.max_repeticiones,
+            'log_path': self.log_path or 'stderr',
+        }
+
+    # ----- salida -----
+
+    def _escribir(self, evento):
+        evento = dict(ts=datetime.now().isoformat(timespec='milliseconds'), pid=os.getpid(), **evento)
+        if has_request_context():
+            evento.setdefault('metodo', request.method)
+            evento.setdefault('ruta', request.url_rule.rule if request.url_rule is not None else request.path)
+        linea = json.dumps(evento, ensure_ascii=False, default=str) + '\n'
+        with self._lock:
+            try:
+                if not self.log_path:
+                    sys.stderr.write(linea)
+                    return
+                if self._archivo is None:
+                    self._archivo = open(self.log_path, 'a', encoding='utf-8', buffering=1)
+                self._archivo.write(linea)
+            except Exception as e:
+                print('Error al escribir el log de consultas:', e)
+
+    # ----- petición -----
+
+    def _inicio_peticion(self):
+        _conteos.set({} if self.activo() else None)
+
+    def _fin_peticion(self, response):
+        conteos = _conteos.get()
+        if conteos:
+            for sql, (veces, segundos) in conteos.items():
+                if veces > self.max_repeticiones:
+                    self._escribir({'evento': 'n_plus_one', 'veces': veces,
+                                    'ms_total': round(segundos * 1000, 3), 'sql': sql,
+                                    'status': response.status_code})
+        _conteos.set(None)
+        return response
+
+    # ----- eventos del engine -----
+
+    def _antes_sql(self, conn, cursor, statement, parameters, context, executemany):
+        if _conteos.get() is not None or self.activo():
+            conn.info['_inicio_perfil'] = time.perf_counter()
+
+    def _despues_sql(self, conn, cursor, statement, parameters, context, executemany):
+        inicio = conn.info.pop('_inicio_perfil', None)
+        if inicio is None:
+            return
+        segundos = time.perf_counter() - inicio
+        conteos = _conteos.get()
+        sql = None
+        if conteos is not None:
+            sql = plantilla(statement)
+            actual = conteos.setdefault(sql, [0, 0.0])
+            actual[0] += 1
+            actual[1] += segundos
+        if segundos >= self.umbral:
+            self._escribir({'evento': 'slow_query', 'ms': round(segundos * 1000, 3),
+                            'sql': sql or plantilla(statement),
+                            'parametros': forma(parameters, executemany)})
@@ -0,0 +1,153 @@
+import os
+import time
+from contextlib import contextmanager
+
+from flask import g, has_request_context, jsonify
+from sqlalchemy import event
+
+
+class RequestSession:
+    """
+    Una sesión ORM por petición HTTP.
+
+    La sesión se abre en el primer `session()` de la petición y la comparten
+    todas las funciones que la usen. Se confirma en after_request si la
+    respuesta es < 400, antes de enviarla: si el COMMIT falla, el cliente
+    recibe un 500 en lugar del éxito ya armado. Con estatus >= 400 se deshace.
+    Se cierra en teardown_request (también si hubo una excepción sin manejar).
+
+    Fuera de una petición (comandos CLI, hilos) `session()` abre una sesión
+    propia que se confirma al salir del bloque, como antes.
+
+    `al_confirmar(db, funcion, *args)` deja una acción fuera de la BD
+    (archivos, colas) para después del COMMIT: si la transacción se deshace,
+    no corre.
+
+    Además mide el tiempo en la BD (eventos de cursor del engine) contra el
+    tiempo total de la petición y lo envía en la cabecera Server-Timing
+    (SERVER_TIMING=0 para omitirla).
+    """
+
+    def __init__(self, session_factory):
+        self.session_factory = session_factory
+        self.server_timing = os.getenv('SERVER_TIMING', '1').strip().lower() not in ('0', 'false', 'no', 'off')
+
+    def registrar(self, app, engine):
+        app.before_request(self._inicio)
+        app.after_request(self._finalizar)
+        app.teardown_request(self._cerrar)
+        event.listen(self.session_factory, 'after_commit', self._after_commit)
+        event.listen(self.session_factory, 'after_soft_rollback', self._after_soft_rollback)
+        event.listen(engine, 'before_cursor_execute', self._antes_sql)
+        event.listen(engine, 'after_cursor_execute', self._despues_sql)
+
+    # ----- sesión -----
+
+    def actual(self):
+        """Sesión de la petición en curso (se abre en el primer uso)."""
+        db = g.get('_db_session')
+        if db is None:
+            db = g._db_session = self.session_factory()
+        return db
+
+    @contextmanager
+    def session(self):
+        if not has_request_context():
+            db = self.session_factory()
+            try:
+                yield db
+                db.commit()
+            except Exception:
+                db.rollback()
+                raise
+            finally:
+                db.close()
+            return
+
+        db = self.actual()
+        try:
+            yield db
+        except Exception:
+            # La ruta suele atrapar la excepción y responder 500; la sesión
+            # queda limpia por si se vuelve a usar en la misma petición
+            db.rollback()
+            raise
+
+    # ----- acciones después del COMMIT -----
+
+    @staticmethod
+    def al_confirmar(db, funcion, *args):
+        db.info.setdefault('al_confirmar', []).append((funcion, args))
+
+    @staticmethod
+    def _after_commit(db):
+        for funcion, args in db.info.pop('al_confirmar', []):
+            try:
+                funcion(*args)
+            except Exception as e:
+                print('Error en acción posterior al commit:', e)
+
+    @staticmethod
+    def _after_soft_rollback(db, previous_transaction):
+        # Solo al deshacer la transacción externa (no un savepoint)
+        if previous_transaction.parent is None:
+            db.info.pop('al_confirmar', None)
+
+    # ----- ciclo de la petición -----
+
+    def _inicio(self):
+        g._inicio_peticion = time.perf_counter()
+        g._db_tiempo = 0.0
+        g._db_consultas = 0
+
+    def _finalizar(self, response):
+        db = g.pop('_db_session', None)
+        if db is not None:
+            try:
+                if response.status_code < 400:
+                    db.commit()
+                else:
+                    db.rollback()
+            except Exception as e:
+                print('Error al confirmar la sesión de la petición:', e)
+                db.rollback()
+                response = jsonify({'success': False, 'error': str(e)})
+                response.status_code = 500
+            finally:
+                db.close()
+        if self.server_timing:
+            t = self.tiempos()
+            response.headers['Server-Timing'] = (
+                f'db;dur={t["db"] * 1000:.1f};desc="{t["consultas"]} sql", '
+                f'total;dur={t["total"] * 1000:.1f}'
+            )
+        return response
+
+    def _cerrar(self, exc):
+        # after_request no corre si hubo una excepción sin manejar
+        db = g.pop('_db_session', None)
+        if db is not None:
+            db.rollback()
+            db.close()
+
+    def tiempos(self):
+        """{'total', 'db' (segundos), 'consultas'} de la petición en curso."""
+        inicio = g.get('_inicio_peticion')
+        return {
+            'total': time.perf_counter() - inicio if inicio is not None else 0.0,
+            'db': g.get('_db_tiempo', 0.0),
+            'consultas': g.get('_db_consultas', 0),
+        }
+
+    # ----- eventos del engine -----
+
+    @staticmethod
+    def _antes_sql(conn, cursor, statement, parameters, context, executemany):
+        conn.info['_inicio_sql'] = time.perf_counter()
+
+    @staticmethod
+    def _despues_sql(conn, cursor, statement, parameters, context, executemany):
+        inicio = conn.info.pop('_inicio_sql', None)
+        if inicio is not None and has_request_context() and '_db_tiempo' in g:
+            g._db_tiempo += time.perf_counter() - inicio
+            g._db_consultas += 1
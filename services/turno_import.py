@@ -0,0 +1,228 @@
+import io
+import re
+import csv
+import json
+from collections import OrderedDict
+from datetime import datetime
+
+from sqlalchemy import select, insert
+
+from model.models import Persona, Turno, normalizar_nombre
+from services import turno_stats
+
+CURP_RE = re.compile(r'^[A-Z0-9]{18}$')
+LOTE = 1000
+MAX_ERRORES = 50
+
+# Nombres de columna aceptados -> campo interno (acepta los del formulario y
+# los de la exportación CSV/NDJSON)
+_ALIAS = {
+    'nombreCompleto': 'nombre_completo',
+    'nombre_completo': 'nombre_completo',
+    'curp': 'curp',
+    'nombre': 'nombre',
+    'paterno': 'paterno',
+    'materno': 'materno',
+    'telefono': 'telefono',
+    'celular': 'celular',
+    'correo': 'correo',
+    'nivel': 'nivel',
+    'municipio': 'municipio',
+    'asunto': 'asunto',
+    'fecha_registro': 'fecha_registro',
+    'fechaRegistro': 'fecha_registro',
+}
+CAMPOS_PERSONA = ('nombre_completo', 'nombre', 'paterno', 'materno', 'telefono', 'celular', 'correo')
+
+
+class FilaInvalida(ValueError):
+    """Error de validación de una fila (o del archivo completo)."""
+
+
+def _sin_escape(valor):
+    # Quita el ' que la exportación CSV antepone a las celdas tipo fórmula
+    # (ver app._celda_csv), para que exportar e importar no altere los datos
+    if isinstance(valor, str) and len(valor) > 1 and valor[0] == "'" and valor[1] in '=+-@\t\r':
+        return valor[1:]
+    return valor
+
+
+def leer_filas(stream, formato):
+    """Recorre el archivo subido sin cargarlo completo y produce
+    (numero_de_linea, dict, error). `formato` es 'csv' o 'ndjson'."""
+    texto = io.TextIOWrapper(stream, encoding='utf-8-sig', newline='')
+    if formato == 'csv':
+        reader = csv.DictReader(texto)
+        for fila in reader:
+            yield reader.line_num, {k: _sin_escape(v) for k, v in fila.items()}, None
+        return
+    for linea, contenido in enumerate(texto, 1):
+        if not contenido.strip():
+            continue
+        try:
+            fila = json.loads(contenido)
+        except ValueError:
+            yield linea, None, 'JSON inválido'
+            continue
+        if not isinstance(fila, dict):
+            yield linea, None, 'Se esperaba un objeto JSON'
+            continue
+        yield linea, fila, None
+
+
+def _fecha(valor):
+    valor = valor.strip()
+    try:
+        fecha = datetime.fromisoformat(re.sub(r'[zZ]$', '+00:00', valor))
+        if fecha.tzinfo is not None:
+            # Con zona horaria (2024-01-01T10:00:00+00:00): a hora local sin
+            # zona, como se guardan las demás fechas
+            fecha = fecha.astimezone().replace(tzinfo=None)
+    except (TypeError, ValueError, OverflowError):
+        raise FilaInvalida(f'fecha_registro inválida: {valor}')
+    if fecha > datetime.now():
+        raise FilaInvalida('fecha_registro no puede ser futura')
+    return fecha
+
+
+def _validar(fila, catalog_cache):
+    datos = {}
+    for clave, valor in fila.items():
+        campo = _ALIAS.get((clave or '').strip())
+        if campo and valor is not None and str(valor).strip():
+            datos[campo] = str(valor).strip()
+
+    curp = datos.get('curp', '').upper()
+    if not CURP_RE.match(curp):
+        raise FilaInvalida('CURP inválida')
+    datos['curp'] = curp
+
+    if 'nombre_completo' not in datos:
+        partes = [datos.get(c) for c in ('nombre', 'paterno', 'materno') if datos.get(c)]
+        if len(partes) < 2:
+            raise FilaInvalida('Falta nombreCompleto (o nombre y paterno)')
+        datos['nombre_completo'] = ' '.join(partes)
+
+    for campo in CAMPOS_PERSONA:
+        largo = Persona.__table__.c[campo].type.length
+        if campo in datos and len(datos[campo]) > largo:
+            raise FilaInvalida(f'{campo} excede {largo} caracteres')
+
+    for cat in ('municipio', 'nivel', 'asunto'):
+        if not datos.get(cat):
+            raise FilaInvalida(f'Falta campo {cat}')
+        id_cat = catalog_cache.id_por_nombre(cat, datos[cat])
+        if not id_cat:
+            raise FilaInvalida(f'{cat} no válido: {datos[cat]}')
+        datos[f'id_{cat}'] = id_cat
+
+    datos['fecha_registro'] = _fecha(datos['fecha_registro']) if datos.get('fecha_registro') else None
+    return datos
+
+
+def validar(filas, catalog_cache, max_filas):
+    """Valida las filas de `leer_filas` en una sola pasada. Devuelve
+    (validas, errores, total_errores); `errores` guarda solo los primeros
+    MAX_ERRORES como {'linea', 'error'}."""
+    validas, errores, total_errores = [], [], 0
+    for linea, fila, error in filas:
+        if error is None:
+            try:
+                validas.append(_validar(fila, catalog_cache))
+            except FilaInvalida as e:
+                error = str(e)
+        if error is not None:
+            total_errores += 1
+            if len(errores) < MAX_ERRORES:
+                errores.append({'linea': linea, 'error': error})
+        if len(validas) + total_errores > max_filas:
+            raise FilaInvalida(f'El archivo excede el máximo de {max_filas} filas')
+    return validas, errores, total_errores
+
+
+def _insertar_personas(db, personas):
+    """Inserta por lotes las personas cuya CURP no existe (las existentes no
+    se modifican) y devuelve ({curp: id_persona} de todas, personas nuevas).
+    Las nuevas se cuentan con el rowcount del INSERT: las que otra
+    transacción creó entre la lectura y el INSERT (ignoradas) no cuentan."""
+    dialecto = db.get_bind().dialect.name
+    ids = {}
+    curps = list(personas)
+    nuevas = 0
+    for i in range(0, len(curps), LOTE):
+        lote = curps[i:i + LOTE]
+        existentes = dict(db.execute(
+            select(Persona.curp, Persona.id_persona).where(Persona.curp.in_(lote))
+        ).all())
+        faltantes = [c for c in lote if c not in existentes]
+        if faltantes:
+            # Core no pasa por los eventos del mapper: nombre_busqueda se calcula aquí
+            valores = [dict(personas[c], curp=c,
+                            nombre_busqueda=normalizar_nombre(personas[c]['nombre_completo']))
+                       for c in faltantes]
+            if dialecto == 'mysql':
+                from sqlalchemy.dialects.mysql import insert as mysql_insert
+                stmt = mysql_insert(Persona).prefix_with('IGNORE')
+            elif dialecto == 'sqlite':
+                from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+                stmt = sqlite_insert(Persona).on_conflict_do_nothing(index_elements=['curp'])
+            else:
+                stmt = insert(Persona)
+            # Un solo INSERT de varias filas: su rowcount es confiable en
+            # todos los motores, a diferencia del de executemany
+            nuevas += db.execute(stmt.values(valores)).rowcount
+            existentes = dict(db.execute(
+                select(Persona.curp, Persona.id_persona).where(Persona.curp.in_(lote))
+            ).all())
+        ids.update(existentes)
+    return ids, nuevas
+
+
+def importar(db, filas, turno_sequence, user_id):
+    """Inserta las filas ya validadas en la transacción de `db`: personas
+    nuevas por lotes, números de turno reservados en bloque por municipio,
+    turnos con INSERT por lotes y los contadores del dashboard en un solo paso.
+    Devuelve un dict con el resumen y los rangos de número por municipio."""
+    # Un bloque de números por municipio (una transacción corta cada uno),
+    # antes de escribir en `db` para no solapar candados
+    por_municipio = OrderedDict()
+    for fila in filas:
+        por_municipio.setdefault(fila['id_municipio'], []).append(fila)
+    rangos = {}
+    for id_municipio, lista in por_municipio.items():
+        primero, ultimo = turno_sequence.allocate_block(id_municipio, len(lista))
+        rangos[id_municipio] = (primero, ultimo)
+        for numero, fila in zip(range(primero, ultimo + 1), lista):
+            fila['numero_turno'] = numero
+
+    personas = OrderedDict()
+    for fila in filas:
+        personas.setdefault(fila['curp'], {c: fila.get(c) for c in CAMPOS_PERSONA})
+    id_por_curp, nuevas = _insertar_personas(db, personas)
+
+    ahora = datetime.now().replace(microsecond=0)
+    deltas = turno_stats.deltas_vacios()
+    valores = []
+    for fila in filas:
+        turno = {
+            'numero_turno': fila['numero_turno'],
+            'id_persona': id_por_curp[fila['curp']],
+            'id_nivel': fila['id_nivel'],
+            'id_municipio': fila['id_municipio'],
+            'id_asunto': fila['id_asunto'],
+            'user_id': user_id,
+            'estatus': turno_stats.ESTATUS_DEFAULT,
+            'fecha_registro': fila['fecha_registro'] or ahora,
+        }
+        valores.append(turno)
+        turno_stats.acumular(deltas, ahora=turno)
+    for i in range(0, len(valores), LOTE):
+        db.execute(insert(Turno), valores[i:i + LOTE])
+    # INSERT por Core: los contadores no pasan por el hook de flush
+    turno_stats.aplicar_deltas(db, deltas)
+
+    return {
+        'importados': len(valores),
+        'personas_nuevas': nuevas,
+        'rangos': rangos,
+    }
@@ -0,0 +1,199 @@
+from collections import Counter
+
+from sqlalchemy import event, select, update, insert, and_
+from sqlalchemy.orm import attributes
+
+from model.models import Turno, TurnoStats, TurnoStatsHora
+
+ESTATUS_DEFAULT = 'Pendiente'
+
+# Atributos de Turno de los que dependen los contadores
+CAMPOS = ('id_municipio', 'estatus', 'id_nivel', 'id_asunto', 'fecha_registro')
+
+
+def hora(fecha):
+    """Inicio de la hora de `fecha`. Nunca se usa el reloj de la aplicación
+    en su lugar: el turno quedaría en otra hora que la que guarda la BD."""
+    if fecha is None:
+        raise ValueError('fecha_registro no cargada: no se puede asignar la hora del turno')
+    return fecha.replace(minute=0, second=0, microsecond=0)
+
+
+def _clave_estatus(v):
+    return (v['id_municipio'], v['estatus'] or ESTATUS_DEFAULT)
+
+
+def _clave_hora(v):
+    # nivel y asunto pueden ser NULL; en la tabla se guardan como 0
+    return (hora(v['fecha_registro']), v['id_municipio'], v['id_nivel'] or 0, v['id_asunto'] or 0)
+
+
+# (modelo, columnas de la clave, función que calcula la clave de un turno)
+CONTADORES = (
+    (TurnoStats, ('id_municipio', 'estatus'), _clave_estatus),
+    (TurnoStatsHora, ('bucket_hora', 'id_municipio', 'id_nivel', 'id_asunto'), _clave_hora),
+)
+
+
+def deltas_vacios():
+    return {modelo: Counter() for modelo, _, _ in CONTADORES}
+
+
+def acumular(deltas, antes=None, ahora=None):
+    """Registra en `deltas` el paso de un turno de los valores `antes` a
+    `ahora` (dicts con CAMPOS; None para alta o baja)."""
+    for modelo, _, clave in CONTADORES:
+        k_antes = clave(antes) if antes else None
+        k_ahora = clave(ahora) if ahora else None
+        if k_antes == k_ahora:
+            continue
+        if k_antes is not None:
+            deltas[modelo][k_antes] -= 1
+        if k_ahora is not None:
+            deltas[modelo][k_ahora] += 1
+    return deltas
+
+
+def _cargado(obj, campo):
+    # Sin disparar un SELECT; fecha_registro ya está cargada después del
+    # INSERT porque Turno usa eager_defaults
+    return attributes.instance_state(obj).dict.get(campo)
+
+
+def _valor_anterior(obj, campo):
+    """Valor de `campo` antes de los cambios pendientes del flush."""
+    hist = attributes.get_history(obj, campo, passive=attributes.PASSIVE_NO_INITIALIZE)
+    if hist.deleted:
+        return hist.deleted[0]
+    if hist.unchanged:
+        return hist.unchanged[0]
+    return _cargado(obj, campo)
+
+
+def deltas_de_flush(session):
+    """Cambios a los contadores que produce el flush en curso."""
+    deltas = deltas_vacios()
+    for obj in session.new:
+        if isinstance(obj, Turno):
+            acumular(deltas, ahora={c: _cargado(obj, c) for c in CAMPOS})
+    for obj in session.deleted:
+        if isinstance(obj, Turno):
+            acumular(deltas, antes={c: _valor_anterior(obj, c) for c in CAMPOS})
+    for obj in session.dirty:
+        if isinstance(obj, Turno) and obj not in session.deleted:
+            acumular(deltas,
+                     antes={c: _valor_anterior(obj, c) for c in CAMPOS},
+                     ahora={c: _cargado(obj, c) for c in CAMPOS})
+    return deltas
+
+
+def aplicar_deltas(conn, deltas):
+    """Suma `deltas` a las tablas de contadores en la transacción de `conn`
+    (Session o Connection). Las rutas masivas que usan UPDATE/DELETE directos
+    (sin pasar por el ORM) deben llamarla con sus propios deltas (ver `acumular`)."""
+    for modelo, columnas, _ in CONTADORES:
+        for clave, delta in deltas.get(modelo, {}).items():
+            if not delta or clave[columnas.index('id_municipio')] is None:
+                continue
+            valores = dict(zip(columnas, clave))
+            res = conn.execute(
+                update(modelo)
+                .where(and_(*(getattr(modelo, c) == v for c, v in valores.items())))
+                .values(total=modelo.total + delta)
+            )
+            if not res.rowcount:
+                _insertar(conn, modelo, columnas, valores, delta)
+
+
+def _insertar(conn, modelo, columnas, valores, delta):
+    # Primera fila de la combinación; con upsert para no chocar con otra
+    # transacción que la cree al mismo tiempo
+    dialecto = conn.get_bind().dialect.name if hasattr(conn, 'get_bind') else conn.dialect.name
+    valores = dict(valores, total=delta)
+    if dialecto == 'mysql':
+        from sqlalchemy.dialects.mysql import insert as mysql_insert
+        stmt = mysql_insert(modelo).values(**valores)
+        stmt = stmt.on_duplicate_key_update(total=modelo.total + delta)
+    elif dialecto == 'sqlite':
+        from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+        stmt = sqlite_insert(modelo).values(**valores)
+        stmt = stmt.on_conflict_do_update(index_elements=list(columnas), set_={'total': modelo.total + delta})
+    else:
+        stmt = insert(modelo).values(**valores)
+    conn.execute(stmt)
+
+
+def _after_flush(session, flush_context):
+    deltas = deltas_de_flush(session)
+    if any(deltas.values()):
+        aplicar_deltas(session, deltas)
+
+
+def registrar(session_factory):
+    """Mantiene los contadores en cada flush de las sesiones de `session_factory`."""
+    event.listen(session_factory, 'after_flush', _after_flush)
+
+
+def leer(db, id_municipio=None):
+    """Filas (id_municipio, estatus, total) con total > 0. O(#municipios)."""
+    query = select(TurnoStats.id_municipio, TurnoStats.estatus, TurnoStats.total).where(TurnoStats.total > 0)
+    if id_municipio is not None:
+        query = query.where(TurnoStats.id_municipio == id_municipio)
+    return db.execute(query).all()
+
+
+def serie_por_hora(db, desde, hasta, dimension, id_municipio=None):
+    """Totales {(bucket_hora, id_dimension): total} entre `desde` (inclusivo)
+    y `hasta` (exclusivo). `dimension` es 'municipio', 'nivel' o 'asunto'."""
+    columna = getattr(TurnoStatsHora, f'id_{dimension}')
+    query = (
+        select(TurnoStatsHora.bucket_hora, columna, TurnoStatsHora.total)
+        .where(TurnoStatsHora.bucket_hora >= desde, TurnoStatsHora.bucket_hora < hasta,
+               TurnoStatsHora.total > 0)
+    )
+    if id_municipio is not None:
+        query = query.where(TurnoStatsHora.id_municipio == id_municipio)
+    totales = Counter()
+    for bucket, id_dim, total in db.execute(query):
+        totales[(bucket, id_dim)] += total
+    return totales
+
+
+def reconciliar(db, lote=5000):
+    """Recalcula los contadores desde turnos y corrige las diferencias.
+    Bloquea primero las filas de turno_stats (que toca todo alta, baja o
+    cambio) para que las transacciones que modifican turnos esperen a que
+    termine. Devuelve el número de filas corregidas."""
+    actuales = {}
+    for modelo, columnas, _ in CONTADORES:
+        cols = [getattr(modelo, c) for c in columnas]
+        actuales[modelo] = {
+            tuple(r[:-1]): r[-1]
+            for r in db.execute(select(*cols, modelo.total).with_for_update())
+        }
+
+    reales = deltas_vacios()
+    filas = db.execute(
+        select(*(getattr(Turno, c) for c in CAMPOS)).execution_options(yield_per=lote)
+    )
+    for fila in filas:
+        acumular(reales, ahora=dict(zip(CAMPOS, fila)))
+
+    corregidas = 0
+    for modelo, columnas, _ in CONTADORES:
+        for clave in set(actuales[modelo]) | set(reales[modelo]):
+            real = reales[modelo].get(clave, 0)
+            if actuales[modelo].get(clave) == real:
+                continue
+            corregidas += 1
+            valores = dict(zip(columnas, clave))
+            if clave in actuales[modelo]:
+                db.execute(
+                    update(modelo)
+                    .where(and_(*(getattr(modelo, c) == v for c, v in valores.items())))
+                    .values(total=real)
+                )
+            else:
+                db.execute(insert(modelo).values(**valores, total=real))
+    db.commit()
+    return corregidas
@@ -127,44 +127,80 @@ function renderCharts(stats) {
     }
   });
 
-  // Actualizar selector de municipios
-  const select = qs('#dashboardMunicipioFilter');
-  const currentValue = select.value;
-  select.innerHTML = '<option value="todos">Todos los Municipios</option>';
-  stats.municipios.forEach(m => {
-    const opt = document.createElement('option');
-    opt.value = m;
-    opt.textContent = m;
-    select.appendChild(opt);
+  // Actualizar selectores de municipios (dashboard y exportación)
+  ['#dashboardMunicipioFilter', '#exportMunicipio'].forEach(sel => {
+    const select = qs(sel);
+    if (!select) return;
+    const currentValue = select.value;
+    select.innerHTML = '<option value="todos">Todos los Municipios</option>';
+    stats.municipios.forEach(m => {
+      const opt = document.createElement('option');
+      opt.value = m;
+      opt.textContent = m;
+      select.appendChild(opt);
+    });
+    select.value = currentValue;
   });
-  select.value = currentValue;
 }
 
-// Búsqueda de turnos
-async function buscarTurnosAdmin() {
-  const curp = qs('#adminCurp').value.trim();
-  const nombre = qs('#adminNombre').value.trim();
+// Exportación: arma la URL con los filtros seleccionados
+function exportarTurnos(formato) {
+  const params = new URLSearchParams();
+  const municipio = qs('#exportMunicipio').value;
+  const estatus = qs('#exportEstatus').value;
+  const desde = qs('#exportDesde').value;
+  const hasta = qs('#exportHasta').value;
+  if (municipio && municipio !== 'todos') params.set('municipio', municipio);
+  if (estatus) params.set('estatus', estatus);
+  if (desde) params.set('desde', desde);
+  if (hasta) params.set('hasta', hasta);
+  window.open(`/api/admin/turnos/export.${formato}?${params.toString()}`, '_blank');
+}
+
+// Búsqueda de turnos (paginada por cursor)
+let busquedaActual = { curp: '', nombre: '', cursor: null, paginas: 0 };
+
+async function buscarTurnosAdmin(siguientePagina = false) {
+  if (!siguientePagina) {
+    busquedaActual = {
+      curp: qs('#adminCurp').value.trim(),
+      nombre: qs('#adminNombre').value.trim(),
+      cursor: null,
+      paginas: 0
+    };
+  }
+  const cuerpo = { curp: busquedaActual.curp, nombre: busquedaActual.nombre };
+  if (siguientePagina) cuerpo.cursor = busquedaActual.cursor;
+  else cuerpo.count = 'estimate';
   try {
     const res = await fetch('/api/admin/search-turnos', {
       method: 'POST',
       headers: {'Content-Type':'application/json'},
-      body: JSON.stringify({ curp, nombre })
+      body: JSON.stringify(cuerpo)
     });
     const data = await res.json();
     if (!data.success) throw new Error(data.error || 'Error');
-    renderTablaAdmin(data.turnos || []);
+    renderTablaAdmin(data.turnos || [], siguientePagina);
+    actualizarSeleccion();
+    busquedaActual.cursor = data.next_cursor;
+    busquedaActual.paginas += 1;
+    qs('#adminCargarMas').classList.toggle('hidden', !data.has_more);
+    if (data.total !== undefined) {
+      qs('#adminTotal').textContent = `${data.total_is_estimate ? 'Aprox. ' : ''}${data.total} turnos`;
+    }
   } catch (e) {
     alert('Error al buscar: ' + e.message);
     console.error(e);
   }
 }
 
-function renderTablaAdmin(turnos) {
+function renderTablaAdmin(turnos, agregar = false) {
   const tbody = qs('#adminTable tbody');
-  tbody.innerHTML = '';
+  if (!agregar) tbody.innerHTML = '';
   turnos.forEach(t => {
     const tr = document.createElement('tr');
     tr.innerHTML = `
+      <td><input type="checkbox" class="sel-turno" value="${t.id}"></td>
       <td>${t.id}</td>
       <td>${t.numero_turno}</td>
       <td>${t.curp || ''}</td>
@@ -186,6 +222,52 @@ function renderTablaAdmin(turnos) {
   });
 }
 
+// Selección múltiple y acciones por lote
+function idsSeleccionados() {
+  return qsa('#adminTable .sel-turno:checked').map(cb => parseInt(cb.value, 10));
+}
+
+function actualizarSeleccion() {
+  const n = idsSeleccionados().length;
+  qs('#adminSeleccion').textContent = `${n} seleccionado${n === 1 ? '' : 's'}`;
+  const total = qsa('#adminTable .sel-turno').length;
+  qs('#adminSeleccionarTodo').checked = total > 0 && n === total;
+}
+
+async function accionLote(accion, seleccion) {
+  const esEliminar = accion === 'eliminar';
+  try {
+    const res = await fetch('/api/admin/turnos/bulk', {
+      method: esEliminar ? 'DELETE' : 'PUT',
+      headers: {'Content-Type':'application/json'},
+      body: JSON.stringify(esEliminar ? seleccion : { ...seleccion, estatus: accion })
+    });
+    const data = await res.json();
+    if (!data.success) throw new Error(data.error || 'Error');
+    alert(`${data.afectados} turno(s) ${esEliminar ? 'eliminado(s)' : 'actualizado(s)'}`);
+    buscarTurnosAdmin();
+    loadDashboardStats(qs('#dashboardMunicipioFilter').value);
+  } catch (e) { alert('Error en la operación por lote: ' + e.message); }
+}
+
+function accionSeleccionados(accion) {
+  const ids = idsSeleccionados();
+  if (!ids.length) { alert('Seleccione al menos un turno'); return; }
+  if (accion === 'eliminar' && !confirm(`¿Eliminar ${ids.length} turno(s)?`)) return;
+  accionLote(accion, { ids });
+}
+
+function resolverPorFiltro() {
+  const filtros = {
+    municipio: qs('#exportMunicipio').value,
+    estatus: qs('#exportEstatus').value,
+    desde: qs('#exportDesde').value,
+    hasta: qs('#exportHasta').value
+  };
+  if (!confirm('¿Marcar como Resueltos todos los turnos que cumplen el filtro?')) return;
+  accionLote('Resuelto', { filtros });
+}
+
 async function eliminarTurno(id) {
   if (!confirm('¿Eliminar este turno?')) return;
   try {
@@ -311,9 +393,39 @@ async function enviarEdicion(e) {
   } catch (e) { alert('Error al guardar: '+e.message); }
 }
 
+// Eventos en vivo (SSE): ante altas, bajas o cambios de estatus se recargan
+// las gráficas y, si se está viendo la primera página, la tabla de resultados.
+// Varias notificaciones seguidas se agrupan en una sola recarga.
+let recargaPendiente = null;
+
+function programarRecarga() {
+  if (recargaPendiente) return;
+  recargaPendiente = setTimeout(() => {
+    recargaPendiente = null;
+    loadDashboardStats(qs('#dashboardMunicipioFilter').value);
+    const enPrimeraPagina = busquedaActual.paginas === 1;
+    if (enPrimeraPagina && qs('#adminEditar').classList.contains('hidden')) {
+      buscarTurnosAdmin();
+    }
+  }, 1000);
+}
+
+function conectarEventos() {
+  if (!window.EventSource) return;
+  const fuente = new EventSource('/api/admin/events');
+  ['turno_creado', 'turno_estatus', 'turno_eliminado', 'turnos_bulk', 'resync'].forEach(tipo => {
+    fuente.addEventListener(tipo, programarRecarga);
+  });
+  // EventSource reconecta solo; si el servidor rechazó la conexión se deja de intentar
+  fuente.onerror = () => {
+    if (fuente.readyState === EventSource.CLOSED) console.warn('Eventos en vivo no disponibles');
+  };
+}
+
 function initAdmin() {
   // Inicializar dashboard
   loadDashboardStats();
+  conectarEventos();
   
   // Cargar catálogos para el formulario de edición
   cargarCatalogosAdmin();
@@ -324,7 +436,26 @@ function initAdmin() {
   });
   
   // Búsqueda
-  qs('#adminBuscarBtn').addEventListener('click', buscarTurnosAdmin);
+  qs('#adminBuscarBtn').addEventListener('click', () => buscarTurnosAdmin());
+  qs('#adminCargarMas').addEventListener('click', () => buscarTurnosAdmin(true));
+
+  // Exportación
+  qs('#exportPdfBtn').addEventListener('click', () => exportarTurnos('pdf'));
+  qs('#exportCsvBtn').addEventListener('click', () => exportarTurnos('csv'));
+  qs('#exportNdjsonBtn').addEventListener('click', () => exportarTurnos('ndjson'));
+  qs('#bulkFiltroResuelto').addEventListener('click', resolverPorFiltro);
+
+  // Selección múltiple
+  qs('#adminSeleccionarTodo').addEventListener('change', function() {
+    qsa('#adminTable .sel-turno').forEach(cb => { cb.checked = this.checked; });
+    actualizarSeleccion();
+  });
+  qs('#adminTable').addEventListener('change', ev => {
+    if (ev.target.classList.contains('sel-turno')) actualizarSeleccion();
+  });
+  qsa('#adminBulk .btn-bulk').forEach(btn => {
+    btn.addEventListener('click', () => accionSeleccionados(btn.dataset.accion));
+  });
   
   // Tabla de resultados
   qs('#adminTable').addEventListener('click', function(ev){
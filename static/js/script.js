@@ -1,15 +1,18 @@
-// Cargar catálogos dinámicamente
+// Cargar catálogos dinámicamente (una sola petición para los tres; el
+// navegador la cachea y la revalida con ETag)
 async function cargarCatalogos(preseleccion = {}) {
   try {
-    // Cargar niveles
-    const nivelesRes = await fetch('/api/public/catalogs/nivel');
-    const nivelesData = await nivelesRes.json();
-    if (nivelesData.success) {
-      const selectsNivel = document.querySelectorAll('select[name="nivel"]');
-      selectsNivel.forEach(select => {
-        const currentValue = preseleccion.nivel || select.value;
+    const res = await fetch('/api/public/catalogs');
+    const data = await res.json();
+    if (!data.success) return;
+
+    ['nivel', 'municipio', 'asunto'].forEach(cat => {
+      const items = data.catalogs[cat] || [];
+      const selects = document.querySelectorAll(`select[name="${cat}"]`);
+      selects.forEach(select => {
+        const currentValue = preseleccion[cat] || select.value;
         select.innerHTML = '<option value="">Seleccione...</option>';
-        nivelesData.items.forEach(item => {
+        items.forEach(item => {
           const option = document.createElement('option');
           option.value = item.name.toLowerCase();
           option.textContent = item.name;
@@ -28,63 +31,7 @@ async function cargarCatalogos(preseleccion = {}) {
           }
         }
       });
-    }
-
-    // Cargar municipios
-    const municipiosRes = await fetch('/api/public/catalogs/municipio');
-    const municipiosData = await municipiosRes.json();
-    if (municipiosData.success) {
-      const selectsMunicipio = document.querySelectorAll('select[name="municipio"]');
-      selectsMunicipio.forEach(select => {
-        const currentValue = preseleccion.municipio || select.value;
-        select.innerHTML = '<option value="">Seleccione...</option>';
-        municipiosData.items.forEach(item => {
-          const option = document.createElement('option');
-          option.value = item.name.toLowerCase();
-          option.textContent = item.name;
-          select.appendChild(option);
-        });
-        // Intentar pre-seleccionar el valor
-        if (currentValue) {
-          const normalizedValue = currentValue.toLowerCase().trim();
-          const matchingOption = Array.from(select.options).find(opt => 
-            opt.value.toLowerCase() === normalizedValue || 
-            opt.textContent.toLowerCase() === normalizedValue
-          );
-          if (matchingOption) {
-            select.value = matchingOption.value;
-          }
-        }
-      });
-    }
-
-    // Cargar asuntos
-    const asuntosRes = await fetch('/api/public/catalogs/asunto');
-    const asuntosData = await asuntosRes.json();
-    if (asuntosData.success) {
-      const selectsAsunto = document.querySelectorAll('select[name="asunto"]');
-      selectsAsunto.forEach(select => {
-        const currentValue = preseleccion.asunto || select.value;
-        select.innerHTML = '<option value="">Seleccione...</option>';
-        asuntosData.items.forEach(item => {
-          const option = document.createElement('option');
-          option.value = item.name.toLowerCase();
-          option.textContent = item.name;
-          select.appendChild(option);
-        });
-        // Intentar pre-seleccionar el valor
-        if (currentValue) {
-          const normalizedValue = currentValue.toLowerCase().trim();
-          const matchingOption = Array.from(select.options).find(opt => 
-            opt.value.toLowerCase() === normalizedValue || 
-            opt.textContent.toLowerCase() === normalizedValue
-          );
-          if (matchingOption) {
-            select.value = matchingOption.value;
-          }
-        }
-      });
-    }
+    });
   } catch (error) {
     console.error('Error cargando catálogos:', error);
   }
@@ -184,8 +131,9 @@ document.getElementById('ticketForm').addEventListener('submit', async function
       <p><strong>Nivel:</strong> ${turno.nombre_nivel || turno.nivel || ''}</p>
       <p><strong>Municipio:</strong> ${turno.nombre_municipio || turno.municipio || ''}</p>
       <p><strong>Asunto:</strong> ${turno.nombre_asunto || turno.asunto || ''}</p>
-      <p><a href="${result.pdf_url}" target="_blank" class="btn btn-primary">Descargar PDF</a></p>
+      <p><a id="pdfDescarga" href="${result.pdf_url}" target="_blank" class="btn btn-primary">Descargar PDF</a></p>
     `;
+    esperarPDF(result.pdf_job, document.getElementById('pdfDescarga'));
 
     // Generar QR en la UI (mismo contenido que va en el PDF)
     try {
@@ -218,6 +166,30 @@ document.getElementById('ticketForm').addEventListener('submit', async function
   }
 });
 
+// El PDF se genera en segundo plano: deshabilitar el enlace hasta que esté listo
+async function esperarPDF(job, link) {
+  if (!job || !link || job.status === 'ready') return;
+  const textoOriginal = link.textContent;
+  link.classList.add('disabled');
+  link.textContent = 'Generando PDF...';
+  for (let intento = 0; intento < 30; intento++) {
+    await new Promise(r => setTimeout(r, 500));
+    try {
+      const res = await fetch(job.status_url);
+      const data = await res.json();
+      if (data.success && data.job.status === 'ready') break;
+      if (data.success && data.job.status === 'error') {
+        link.textContent = 'Error al generar PDF';
+        return;
+      }
+    } catch (e) {
+      console.warn('No se pudo consultar el estado del PDF:', e);
+    }
+  }
+  link.classList.remove('disabled');
+  link.textContent = textoOriginal;
+}
+
 // Función para convertir datos del formulario a JSON
 function formDataToJson(formData) {
   const data = {};
@@ -318,6 +290,7 @@ document.getElementById('formModificar').addEventListener('submit', async functi
     // Mostrar mensaje de éxito y enlace al nuevo PDF
     document.getElementById('pdfActualizado').classList.remove('hidden');
     document.getElementById('pdfLink').href = result.turno.pdf_url;
+    esperarPDF(result.pdf_job, document.getElementById('pdfLink'));
 
     alert('Turno actualizado correctamente');
 